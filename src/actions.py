@@ -0,0 +1,332 @@
+import logging
+import ctypes
+from array import array
+
+from ovr import FINGERS, SPLAYFINGERS
+
+TOUCH_ACTIONS = slice(2, 10)
+SPECIAL_PARAMETERS = ("ControllerType", "LeftThumb", "RightThumb", "LeftABButtons", "RightABButtons")
+# flFingerCurl and flFingerSplay are laid out back to back in VRSkeletalSummaryData_t
+SKELETON_VALUES = len(FINGERS) + len(SPLAYFINGERS)
+SKELETON_SIZE = SKELETON_VALUES * ctypes.sizeof(ctypes.c_float)
+RANGE_ENDS = (0.0, 1.0, -1.0)
+# Where the value of an action comes from
+SOURCE_OVR = "ovr"
+SOURCE_XINPUT = "xinput"
+SOURCE_SPECIAL = "special"
+
+
+class Action:
+    """
+    An action from the config, compiled into a reader and a sender that are bound once at startup.
+    """
+    __slots__ = ("name", "type", "osc_parameter", "enabled", "always", "floating", "timestamp", "last_value", "unsigned", "binary", "reader", "sender", "value", "timer", "filter", "source", "feeds", "last_press")
+
+    def __init__(self, action: dict, reader, sender, filter=None) -> None:
+        self.name = action.get("name", action["osc_parameter"])
+        self.type = action.get("type", "boolean")
+        self.osc_parameter = action["osc_parameter"]
+        self.enabled = _copy(action["enabled"])
+        self.always = _copy(action["always"])
+        self.floating = _copy(action.get("floating", 0.0))
+        self.timestamp = _copy(action.get("timestamp", 0))
+        self.last_value = _copy(action["last_value"])
+        self.unsigned = _copy(action.get("unsigned"))
+        self.binary = _copy(action.get("binary", False))
+        self.reader = reader
+        self.sender = sender
+        self.value = None
+        self.timer = None
+        self.filter = filter
+        self.source = SOURCE_OVR
+        # Special parameters derived from the value of this action
+        self.feeds = []
+        # Whether the button was held on the previous send, so a toggle flips once per press
+        self.last_press = False
+
+    def read(self) -> None:
+        """
+        Reads the current value without sending it.
+        Returns:
+            None
+        """
+        self.value = self.reader()
+
+    def update(self) -> None:
+        """
+        Reads the current value and sends it.
+        Returns:
+            None
+        """
+        self.value = value = self.reader()
+        self.sender(self, value)
+
+
+class ChangeAction(Action):
+    """
+    An action whose reader also reports whether the value changed since the last tick.
+    Unchanged values are not passed to the sender, so this is only used for actions that send on change.
+    """
+    __slots__ = ()
+
+    def read(self) -> None:
+        self.value = self.reader()[0]
+
+    def update(self) -> None:
+        value, changed = self.reader()
+        if changed or self.value is None:
+            self.sender(self, value)
+        self.value = value
+
+
+class SkeletonAction(Action):
+    """
+    A skeleton action. Curl and splay of every finger are copied into one fixed float buffer,
+    so change detection runs over all values in a single pass and only changed values are sent.
+    """
+    __slots__ = ("parameters", "buffer", "address")
+
+    def __init__(self, action: dict, reader, sender, filter=None) -> None:
+        super().__init__(action, reader, sender, filter)
+        self.parameters = skeleton_parameters(self.osc_parameter)
+        self.buffer = array("f", bytes(SKELETON_SIZE))
+        self.address = self.buffer.buffer_info()[0]
+        self.last_value = array("f", bytes(SKELETON_SIZE))
+        self.timestamp = array("d", bytes(SKELETON_VALUES * ctypes.sizeof(ctypes.c_double)))
+
+
+class AnalogFilter:
+    """
+    Deadband and quantization for analog values, applied before change detection so sensor noise is not sent.
+
+    deadband: changes up to this absolute amount are dropped
+    quantize: number of steps per unit the value is snapped to, 0 to disable
+    hysteresis: extra margin a value has to move past the deadband or the middle between two steps before it changes
+    """
+    __slots__ = ("deadband", "step", "hysteresis")
+
+    def __init__(self, deadband: float = 0.0, quantize: int = 0, hysteresis: float = 0.0) -> None:
+        self.deadband = deadband
+        self.step = 1 / quantize if quantize else 0.0
+        self.hysteresis = hysteresis
+
+    def apply(self, value: float, last_value: float) -> float:
+        """
+        Filters a value against the last sent value.
+        Parameters:
+            value (float): New value
+            last_value (float): Last sent value
+        Returns:
+            float: Value to send, last_value if the change is too small
+        """
+        if value == last_value or value in RANGE_ENDS:
+            # Always let rest and full positions through, so values can't get stuck just before them
+            return value
+        delta = abs(value - last_value)
+        if delta <= self.deadband + self.hysteresis:
+            return last_value
+        if self.step:
+            if delta <= self.step / 2 + self.hysteresis:
+                return last_value
+            value = round(value / self.step) * self.step
+        return value
+
+
+def make_filter(action: dict, config: dict, index: int | None = None) -> AnalogFilter | None:
+    """
+    Creates the analog filter for an action, or one component of a vector2 action.
+    Settings of the action take precedence over the global Deadband, Quantize and Hysteresis settings.
+    Parameters:
+        action (dict): Action
+        config (dict): Config
+        index (int | None): Component of a vector2 action
+    Returns:
+        AnalogFilter | None: Filter, None if filtering is disabled
+    """
+    def setting(key, default_key):
+        value = action.get(key)
+        if isinstance(value, list):
+            value = value[index]
+        return config.get(default_key, 0) if value is None else value
+
+    deadband = float(setting("deadband", "Deadband"))
+    quantize = int(setting("quantize", "Quantize"))
+    hysteresis = float(setting("hysteresis", "Hysteresis"))
+    if not deadband and not quantize and not hysteresis:
+        return None
+    return AnalogFilter(deadband, quantize, hysteresis)
+
+
+def skeleton_parameters(osc_parameter: str) -> tuple:
+    """
+    Gets the OSC parameters of a skeleton action, in the order of the values in VRSkeletalSummaryData_t.
+    Parameters:
+        osc_parameter (str): Base OSC parameter of the action
+    Returns:
+        tuple: OSC parameters
+    """
+    parameters = [None] * SKELETON_VALUES
+    for fname, fidx in FINGERS.items():
+        parameters[fidx] = f"{osc_parameter}/Curl/{fname}"
+    for fname, fidx in SPLAYFINGERS.items():
+        parameters[len(FINGERS) + fidx] = f"{osc_parameter}/Splay/{fname}"
+    return tuple(parameters)
+
+
+def _sends_on_change_only(action: dict) -> bool:
+    always = action["always"]
+    return not any(always) if isinstance(always, list) else not always
+
+
+def _copy(value):
+    return list(value) if isinstance(value, list) else value
+
+
+def _is_enabled(enabled: bool | list) -> bool:
+    return any(enabled) if isinstance(enabled, list) else enabled
+
+
+def _thumb_reader(touch_actions: list):
+    def read() -> int:
+        for i in range(len(touch_actions) - 1, -1, -1):
+            if touch_actions[i].value:
+                return i + 1
+        return 0
+    return read
+
+
+def _ab_reader(touch_actions: list):
+    def read() -> bool:
+        return bool(touch_actions[0].value and touch_actions[1].value)
+    return read
+
+
+def compile_actions(config: dict, ovr, xinput, osc) -> list:
+    """
+    Compiles the actions of the config into a list of Action objects in the order they are updated every tick.
+    Disabled actions are dropped, unless their value is needed by an enabled special parameter.
+    Parameters:
+        config (dict): Config
+        ovr (OVR): SteamVR input
+        xinput (XboxController): XInput controller
+        osc (OSC): OSC client
+    Returns:
+        list: Compiled actions
+    """
+    def controller_type() -> int:
+        _controller_type = ovr.get_controllertype()
+        if _controller_type == 0 and xinput.is_plugged:
+            _controller_type = 10
+        elif _controller_type != 0 and xinput.is_plugged:
+            _controller_type += 10
+        return _controller_type
+
+    def special(name, reader) -> Action:
+        compiled_action = Action({**config[name], "osc_parameter": name}, reader, osc.get_sender("boolean"))
+        compiled_action.source = SOURCE_SPECIAL
+        return compiled_action
+
+    def compile_action(action, reader, change_reader=None) -> Action:
+        sender = osc.get_sender(action["type"], action["floating"])
+        cls = Action
+        if change_reader is not None and event_driven and _sends_on_change_only(action):
+            # SteamVR already knows whether the action changed, so unchanged actions skip the sender entirely
+            cls, reader = ChangeAction, change_reader
+        match action["type"]:
+            case "skeleton":
+                return SkeletonAction(action, reader, sender, make_filter(action, config))
+            case "vector1":
+                return cls(action, reader, sender, make_filter(action, config))
+            case "vector2":
+                filters = [make_filter(action, config, i) for i in range(2)]
+                return cls(action, reader, sender, filters if any(filters) else None)
+            case _:
+                return cls(action, reader, sender)
+
+    def compile_ovr_action(action) -> Action:
+        return compile_action(action, ovr.get_reader(action), ovr.get_change_reader(action))
+
+    event_driven = bool(config.get("EventDrivenInput", True))
+    compiled = []
+
+    if config["ControllerType"]["enabled"]:
+        # Answered from the tracked device registry, cheap enough to read every tick
+        compiled.append(special("ControllerType", controller_type))
+
+    for action in config["actions"][:TOUCH_ACTIONS.start]: # Skeleton Actions
+        if _is_enabled(action["enabled"]):
+            compiled.append(compile_ovr_action(action))
+
+    touch = [compile_ovr_action(action) for action in config["actions"][TOUCH_ACTIONS]]
+    touch_needed = any(config[name]["enabled"] for name in SPECIAL_PARAMETERS[1:])
+    for action, compiled_action in zip(config["actions"][TOUCH_ACTIONS], touch):
+        if _is_enabled(action["enabled"]) or touch_needed:
+            compiled.append(compiled_action)
+    half = len(touch) // 2
+    for name, make_reader, sources in (("LeftThumb", _thumb_reader, touch[:half]), ("RightThumb", _thumb_reader, touch[half:]),
+                                       ("LeftABButtons", _ab_reader, touch[:half]), ("RightABButtons", _ab_reader, touch[half:])):
+        if config[name]["enabled"]:
+            compiled_action = special(name, make_reader(sources))
+            for source in sources:
+                source.feeds.append(compiled_action)
+            compiled.append(compiled_action)
+
+    for action in config["actions"][TOUCH_ACTIONS.stop:]:
+        if _is_enabled(action["enabled"]):
+            compiled.append(compile_ovr_action(action))
+
+    for action in config["xinput_actions"]:
+        if _is_enabled(action["enabled"]):
+            compiled_action = compile_action(action, xinput.get_reader(action))
+            compiled_action.source = SOURCE_XINPUT
+            compiled.append(compiled_action)
+
+    logging.info(f"Compiled {len(compiled)} actions.")
+    return compiled
+
+
+def _get_step(action: Action, is_sent=None):
+    def sent(action) -> bool:
+        return _is_enabled(action.enabled) and (is_sent is None or is_sent(action))
+
+    if sent(action):
+        return action.update
+    if any(sent(special) for special in action.feeds):
+        return action.read
+    return None
+
+
+def get_steps(compiled: list, is_sent=None) -> list:
+    """
+    Gets the flat list of callables that make up one tick.
+    Actions that are not sent but feed a special parameter that is, are read without being sent, all others are skipped.
+    Parameters:
+        compiled (list): Compiled actions
+        is_sent (function | None): Function that takes an action and returns False if its parameters are not on the current avatar
+    Returns:
+        list: Callables to run every tick
+    """
+    steps = []
+    for action in compiled:
+        step = _get_step(action, is_sent)
+        if step is not None:
+            steps.append(step)
+    return steps
+
+
+def get_stage_steps(compiled: list, is_sent=None) -> dict:
+    """
+    Gets the callables that make up one tick grouped by the source of their values.
+    Special parameters run last, as they are derived from the values the SteamVR actions read in the same tick.
+    Parameters:
+        compiled (list): Compiled actions
+        is_sent (function | None): Function that takes an action and returns False if its parameters are not on the current avatar
+    Returns:
+        dict: Callables by source (SOURCE_*), in the order they run
+    """
+    stages = {SOURCE_OVR: [], SOURCE_XINPUT: [], SOURCE_SPECIAL: []}
+    for action in compiled:
+        step = _get_step(action, is_sent)
+        if step is not None:
+            stages[action.source].append(step)
+    return stages
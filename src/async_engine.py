@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+
+class OSCDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol for OSC. Received packets are handed to a python-osc dispatcher right on the event loop.
+    """
+
+    def __init__(self, dispatcher=None) -> None:
+        self.dispatcher = dispatcher
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if self.dispatcher is not None:
+            self.dispatcher.call_handlers_for_packet(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        # Sending to a closed port (VRChat not listening yet) shows up here on some platforms
+        logging.debug(f"OSC socket error: {exc}")
+
+
+class AsyncEngine:
+    """
+    Runs OSC sending, the OSC server and the tick scheduler on a single asyncio event loop,
+    instead of a blocking socket, a server thread and a thread per received datagram.
+    """
+
+    def __init__(self, osc, scheduler) -> None:
+        self.osc = osc
+        self.scheduler = scheduler
+
+    async def run(self, tick) -> None:
+        """
+        Opens the OSC endpoints and runs tick on the scheduler until it is stopped.
+        Parameters:
+            tick (function): Function to call every tick
+        Returns:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        send_transport, _ = await loop.create_datagram_endpoint(OSCDatagramProtocol, remote_addr=self.osc.osc_address)
+        server_transport = None
+        if self.osc.disp is not None:
+            server_transport, _ = await loop.create_datagram_endpoint(lambda: OSCDatagramProtocol(self.osc.disp), local_addr=(self.osc.ip, self.osc.server_port))
+            logging.info(f"Starting OSC server on {self.osc.ip}:{self.osc.server_port} (asyncio)")
+
+        send_datagram = self.osc.send_datagram
+        self.osc.send_datagram = send_transport.sendto
+        try:
+            await self.scheduler.run_async(tick)
+        finally:
+            self.osc.flush()
+            self.osc.send_datagram = send_datagram
+            send_transport.close()
+            if server_transport is not None:
+                server_transport.close()
+
+    def stop(self) -> None:
+        """
+        Stops the engine after the current tick.
+        Returns:
+            None
+        """
+        self.scheduler.stop()
@@ -0,0 +1,124 @@
+import logging
+import time
+from threading import Lock
+
+PRIORITY_CRITICAL = 0 # Booleans, toggles and ints, anything a button press drives
+PRIORITY_ANALOG = 1 # Triggers, sticks, trackpads
+PRIORITY_BULK = 2 # Skeleton curl and splay
+PRIORITY_NAMES = ("critical", "analog", "bulk")
+
+
+class BandwidthBudget:
+    """
+    Token bucket limiting the number of OSC messages per second.
+
+    Messages are queued per priority class, keeping only the latest value per parameter.
+    A value can be made of several messages, like the bits of a binary parameter, which are sent together or not at all.
+    Every drain first sends the values that changed, strictly in order of priority class,
+    within a class the ones furthest away from the value VRChat last received go first.
+    A changed value that doesn't fit holds up everything after it, the tokens are saved up for it
+    instead of going to smaller values of lower classes, which could otherwise starve it forever.
+    Repeats of values VRChat already has only get the tokens that are left over and are dropped if there are none.
+    """
+
+    def __init__(self, messages_per_second: float, burst_time: float = 0.1, clock=time.monotonic) -> None:
+        self.rate = messages_per_second
+        self.capacity = max(1.0, messages_per_second * burst_time)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.last_refill = clock()
+        self.pending = [{} for _ in PRIORITY_NAMES]
+        self.sent_values = {}
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.coalesced = [0] * len(PRIORITY_NAMES)
+        self.dropped = [0] * len(PRIORITY_NAMES)
+        self._lock = Lock()
+
+    def offer(self, parameter: str, value, priority: int, messages: list | None = None) -> None:
+        """
+        Queues a value, replacing a pending value of the same parameter.
+        Parameters:
+            parameter (str): Name of the parameter
+            value (any): Value of the parameter
+            priority (int): Priority class
+            messages (list | None): (parameter, value) tuples the value is sent as, None to send it as a single message
+        Returns:
+            None
+        """
+        with self._lock:
+            pending = self.pending[priority]
+            if parameter in pending:
+                self.coalesced[priority] += 1
+            pending[parameter] = (value, messages)
+
+    def reset(self) -> None:
+        """
+        Forgets the values VRChat last received, so the next values are not taken for repeats.
+        Returns:
+            None
+        """
+        with self._lock:
+            self.sent_values.clear()
+
+    def _error(self, parameter: str, value) -> float:
+        if parameter not in self.sent_values:
+            return float("inf")
+        return abs(value - self.sent_values[parameter])
+
+    def drain(self) -> list:
+        """
+        Takes the messages that fit into the budget out of the queues.
+        Returns:
+            list: (parameter, value) tuples to send now
+        """
+        now = self.clock()
+        with self._lock:
+            tokens = self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            messages = []
+            blocked = False
+            for repeats in (False, True):
+                for priority, pending in enumerate(self.pending):
+                    if not pending:
+                        continue
+                    selected = [(parameter, entry) for parameter, entry in pending.items() if (self._error(parameter, entry[0]) == 0) == repeats]
+                    if not repeats and sum(len(entry[1]) if entry[1] else 1 for _, entry in selected) > tokens:
+                        selected.sort(key=lambda item: self._error(item[0], item[1][0]), reverse=True)
+                    for parameter, (value, group) in selected:
+                        cost = len(group) if group else 1
+                        # A value of more messages than the bucket holds goes out whenever the bucket is full
+                        if blocked or cost > tokens and not (cost > self.capacity and tokens >= self.capacity):
+                            if repeats:
+                                del pending[parameter]
+                                self.dropped[priority] += 1
+                            else:
+                                blocked = True
+                            continue
+                        tokens -= cost
+                        del pending[parameter]
+                        self.sent_values[parameter] = value
+                        if group:
+                            messages.extend(group)
+                        else:
+                            messages.append((parameter, value))
+                        self.sent[priority] += cost
+            self.tokens = tokens
+        return messages
+
+    def get_stats(self) -> dict:
+        """
+        Gets the send, coalesce and drop counters of every priority class.
+        Returns:
+            dict: Counters by priority class name
+        """
+        return {name: {"sent": self.sent[i], "coalesced": self.coalesced[i], "dropped": self.dropped[i], "pending": len(self.pending[i])} for i, name in enumerate(PRIORITY_NAMES)}
+
+    def log_stats(self) -> None:
+        """
+        Logs the counters of every priority class.
+        Returns:
+            None
+        """
+        logging.info(f"Bandwidth budget: {self.rate:g} messages/s")
+        for name, stats in self.get_stats().items():
+            logging.info(f"  {name}: sent {stats['sent']}, coalesced {stats['coalesced']}, dropped {stats['dropped']}, pending {stats['pending']}")
@@ -0,0 +1,268 @@
+"""
+Microbenchmarks of the per tick hot path, run against the replay backends with a fake UDP socket.
+
+Reports ns per call, OSC messages per call and memory per call for every benchmark:
+    alloc_bytes     bytes allocated on top of what was live before the call, at the peak during the call (tracemalloc)
+    alloc_blocks    memory blocks still allocated after the call, anything but 0 grows with every tick
+
+Usage:
+    python benchmark.py [--ticks 2000] [--json results.json] [--only handle_input]
+"""
+import argparse
+import copy
+import ctypes
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from actions import Action, SkeletonAction, compile_actions, get_steps, SKELETON_VALUES
+from osc import OSC
+from replay import ReplayOVR, ReplayXboxController, synthetic_trace
+from tick import run_tick
+from tinyoscquery.shared.node import OSCQueryNode
+from xbox_controller import dz_scaled_radial
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+# Rate the synthetic input trace is generated at, one frame is applied per tick
+TRACE_RATE = 120.0
+ALLOC_SAMPLES = 200
+
+
+def _set_all(config: dict, key: str, value) -> None:
+    for action in config["actions"] + config["xinput_actions"]:
+        action[key] = [value] * len(action[key]) if isinstance(action[key], list) else value
+    for name in ("ControllerType", "LeftThumb", "RightThumb", "LeftABButtons", "RightABButtons"):
+        if key in config[name]:
+            config[name][key] = value
+
+
+def _configure(config: dict, variant: str) -> dict:
+    config = copy.deepcopy(config)
+    match variant:
+        case "defaults":
+            pass
+        case "on_change":
+            _set_all(config, "always", 0)
+        case "on_positive":
+            _set_all(config, "always", 1)
+        case "skeleton":
+            _set_all(config, "enabled", False)
+            for action in config["actions"]:
+                if action["type"] == "skeleton":
+                    action["enabled"] = True
+        case "binary":
+            for action in config["actions"] + config["xinput_actions"]:
+                if action["type"] == "vector1":
+                    action["binary"] = True
+                elif action["type"] == "vector2":
+                    action["binary"] = [True, True] + action["binary"][2:]
+        case _:
+            raise ValueError(f"Unknown config variant: {variant}")
+    return config
+
+
+class DatagramSink:
+    """
+    Stands in for the UDP socket, counting the datagrams instead of sending them.
+    """
+
+    def __init__(self) -> None:
+        self.datagrams = 0
+        self.bytes = 0
+
+    def __call__(self, data) -> None:
+        self.datagrams += 1
+        self.bytes += len(data)
+
+
+def _make_osc(config: dict) -> OSC:
+    osc = OSC(config, lambda addr, value: None, False)
+    osc.send_datagram = DatagramSink()
+    return osc
+
+
+def measure(function, iterations: int, osc: OSC | None = None) -> dict:
+    """
+    Measures a function without arguments.
+    Parameters:
+        function (function): Function to measure
+        iterations (int): Number of calls to time
+        osc (OSC | None): OSC client whose sent messages are counted
+    Returns:
+        dict: ns, messages, alloc_bytes and alloc_blocks per call
+    """
+    for _ in range(min(iterations, 100)):
+        function()
+
+    messages = osc.sent_messages if osc is not None else 0
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter_ns() - start
+    messages = (osc.sent_messages - messages) / iterations if osc is not None else 0.0
+
+    samples = min(iterations, ALLOC_SAMPLES)
+    tracemalloc.start()
+    peak = 0
+    blocks = sys.getallocatedblocks()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        function()
+        peak += tracemalloc.get_traced_memory()[1] - current
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "ns": elapsed / iterations,
+        "messages": messages,
+        "alloc_bytes": peak / samples,
+        "alloc_blocks": max(0, blocks) / samples
+    }
+
+
+def bench_handle_input(config: dict, variant: str, ticks: int) -> dict:
+    config = _configure(config, variant)
+    # Enough trace for the warmup, the timed run and the allocation samples
+    frames = synthetic_trace(config, duration=(ticks + ALLOC_SAMPLES + 100) / TRACE_RATE, rate=TRACE_RATE)
+    xinput = ReplayXboxController()
+    ovr = ReplayOVR(frames, 0, xinput)
+    osc = _make_osc(config)
+    steps = get_steps(compile_actions(config, ovr, xinput, osc), osc.is_on_avatar)
+
+    # The tick handle_input() in main.py runs
+    return measure(lambda: run_tick(ovr, osc, steps), ticks, osc)
+
+
+def bench_send_vector2(config: dict, iterations: int) -> dict:
+    osc = _make_osc(config)
+    action_dict = next(action for action in config["actions"] if action["type"] == "vector2")
+    action = Action(action_dict, None, None)
+    values = [(math.sin(i / 10), math.cos(i / 10)) for i in range(64)]
+    i = 0
+
+    def send() -> None:
+        nonlocal i
+        i += 1
+        osc._send_vector2(action, values[i & 63])
+
+    return measure(send, iterations, osc)
+
+
+def bench_send_skeleton(config: dict, iterations: int) -> dict:
+    osc = _make_osc(config)
+    action_dict = next(action for action in config["actions"] if action["type"] == "skeleton")
+    action = SkeletonAction(action_dict, None, None)
+    skeletons = []
+    for i in range(64):
+        skeleton = (ctypes.c_float * SKELETON_VALUES)()
+        skeleton[:] = [(math.sin(i / 10 + j) + 1) / 2 for j in range(SKELETON_VALUES)]
+        skeletons.append(skeleton)
+    i = 0
+
+    def send() -> None:
+        nonlocal i
+        i += 1
+        osc._send_skeleton(action, skeletons[i & 63])
+
+    return measure(send, iterations, osc)
+
+
+def bench_float_to_binary(config: dict, iterations: int) -> dict:
+    osc = _make_osc(config)
+    values = [math.sin(i / 10) for i in range(64)]
+    i = 0
+
+    def convert() -> None:
+        nonlocal i
+        i += 1
+        osc._float_to_binary(values[i & 63])
+
+    return measure(convert, iterations)
+
+
+def bench_dz_scaled_radial(iterations: int) -> dict:
+    values = [(math.sin(i / 10), math.cos(i / 7)) for i in range(64)]
+    i = 0
+
+    def scale() -> None:
+        nonlocal i
+        i += 1
+        x, y = values[i & 63]
+        dz_scaled_radial(x, y, 0.2)
+
+    return measure(scale, iterations)
+
+
+def bench_find_subnode(config: dict, iterations: int) -> dict:
+    # A tree shaped like the one VRChat serves, with a node per OSC parameter of the config
+    root = OSCQueryNode("/")
+    parameters = []
+    for action in config["actions"] + config["xinput_actions"]:
+        osc_parameters = action["osc_parameter"] if isinstance(action["osc_parameter"], list) else [action["osc_parameter"]]
+        parameters.extend(osc_parameters)
+    for i in range(256 - len(parameters)):
+        parameters.append(f"Avatar/Parameter{i}")
+    for parameter in parameters:
+        root.add_child_node(OSCQueryNode(f"/avatar/parameters/{parameter}"))
+    root.add_child_node(OSCQueryNode("/avatar/change"))
+    last = f"/avatar/parameters/{parameters[-1]}"
+
+    return measure(lambda: root.find_subnode(last), iterations)
+
+
+def run(config: dict, ticks: int, only: str | None = None) -> dict:
+    """
+    Runs the benchmarks.
+    Parameters:
+        config (dict): Config
+        ticks (int): Number of timed calls per benchmark
+        only (str | None): Only run benchmarks whose name contains this
+    Returns:
+        dict: Results by benchmark name
+    """
+    benchmarks = {f"handle_input[{variant}]": (lambda variant=variant: bench_handle_input(config, variant, ticks)) for variant in ("defaults", "on_change", "on_positive", "skeleton", "binary")}
+    benchmarks.update({
+        "OSC._send_vector2": lambda: bench_send_vector2(config, ticks * 10),
+        "OSC._send_skeleton": lambda: bench_send_skeleton(config, ticks * 10),
+        "OSC._float_to_binary": lambda: bench_float_to_binary(config, ticks * 10),
+        "dz_scaled_radial": lambda: bench_dz_scaled_radial(ticks * 10),
+        "OSCQueryNode.find_subnode": lambda: bench_find_subnode(config, ticks)
+    })
+    results = {}
+    for name, bench in benchmarks.items():
+        if only is not None and only not in name:
+            continue
+        results[name] = result = bench()
+        print(f"{name.ljust(32)}{result['ns']:12.0f} ns{result['messages']:10.1f} msg{result['alloc_bytes']:10.0f} B{result['alloc_blocks']:8.2f} blocks")
+    return results
+
+
+if __name__ == "__main__":
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the ThumbParamsOSC hot path")
+    parser.add_argument("-t", "--ticks", type=int, default=2000, help="number of timed ticks per handle_input benchmark, function benchmarks run 10 times as many calls. Default=2000")
+    parser.add_argument("-j", "--json", type=str, help="write the results to this JSON file")
+    parser.add_argument("-o", "--only", type=str, help="only run benchmarks whose name contains this")
+    parser.add_argument("-c", "--config", type=str, default=CONFIG_PATH, help=f"config to benchmark. Default={CONFIG_PATH}")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    results = run(config, args.ticks, args.only)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "ticks": args.ticks,
+                "results": results
+            }, f, indent=4)
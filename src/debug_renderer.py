@@ -0,0 +1,182 @@
+import logging
+import os
+import sys
+import threading
+from collections import deque
+
+CELL_WIDTH = 64
+COLUMNS = 2
+# Rows above the parameter table: filter savings, bandwidth budget and a blank line
+HEADER_ROWS = 3
+CLEAR_SCREEN = "\x1b[2J\x1b[H"
+HIDE_CURSOR = "\x1b[?25l"
+SHOW_CURSOR = "\x1b[?25h"
+# Level of the console log while the table is drawn, anything below goes to the log file only
+CONSOLE_LOG_LEVEL = logging.WARNING
+# Lines of the log area below the table, showing the latest console log lines
+LOG_ROWS = 8
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return str(value)
+
+
+def _format_mode(floating, always) -> str:
+    floating = f"Floating: {floating}s" if floating != "" and float(floating) > 0 else ""
+    match always:
+        case 0:
+            always = "SOC"
+        case 1:
+            always = "SOP"
+        case _:
+            always = ""
+    return f"{floating.ljust(16)} {always}"
+
+
+class DebugRenderer:
+    """
+    Draws the debug table on its own thread at a capped refresh rate.
+    Every refresh reads the current values and only rewrites the cells that changed, using ANSI cursor addressing,
+    so the polling loop never waits for the console.
+    Log records that would reach the console are shown in a log area below the table instead, so they neither scroll
+    the table nor get overwritten by it.
+    """
+
+    def __init__(self, actions: list, osc, refresh_rate: float = 10.0, stream=None, console_handler: logging.Handler | None = None) -> None:
+        self.osc = osc
+        self.interval = 1 / refresh_rate
+        self.stream = stream if stream is not None else sys.stdout
+        self.entries = []
+        for action in actions:
+            if action.type == "skeleton":
+                for i, parameter in enumerate(action.parameters):
+                    self.entries.append((parameter, action, i, _format_mode(action.floating, action.always)))
+            elif action.type == "vector2":
+                for i, parameter in enumerate(action.osc_parameter):
+                    if action.enabled[i]:
+                        self.entries.append((parameter, action, i, _format_mode(action.floating[i], action.always[i])))
+            elif action.enabled:
+                self.entries.append((action.osc_parameter, action, None, _format_mode(action.floating, action.always)))
+        self.log_lines = deque(maxlen=LOG_ROWS)
+        self._log_start = len(self.entries) + HEADER_ROWS - 1
+        self.cells = [None] * (self._log_start + LOG_ROWS)
+        self._stop = threading.Event()
+        self._thread = None
+        self._redraw = False
+        self.console_handler = console_handler
+        self._console_level = None
+
+
+    def invalidate(self) -> None:
+        """
+        Makes the next refresh clear the screen and redraw every cell, after something else wrote to the console.
+        Returns:
+            None
+        """
+        self._redraw = True
+
+
+    def _on_log_record(self, record: logging.LogRecord) -> bool:
+        # Keeps the record for the log area, the handler itself must not write between the cells
+        self.log_lines.extend(self.console_handler.format(record).splitlines())
+        return False
+
+
+    def _get_cells(self) -> list:
+        osc = self.osc
+        cells = [osc.get_filter_savings()]
+        if osc.budget is not None:
+            cells.append(" | ".join(f"{name}: {stats['sent']} sent, {stats['coalesced']} coalesced, {stats['dropped']} dropped" for name, stats in osc.budget.get_stats().items()))
+        else:
+            cells.append("")
+        for parameter, action, index, mode in self.entries:
+            value = action.last_value if index is None else action.last_value[index]
+            cells.append(f"{parameter.ljust(32)} {_format_value(value).ljust(8)} {mode}")
+        log_lines = list(self.log_lines)
+        cells.extend(log_lines + [""] * (LOG_ROWS - len(log_lines)))
+        return cells
+
+
+    def _get_table_end(self) -> int:
+        return HEADER_ROWS + 1 + (len(self.entries) + COLUMNS - 1) // COLUMNS
+
+
+    def _position(self, index: int) -> tuple[int, int]:
+        if index < HEADER_ROWS - 1:
+            return index + 1, 1
+        if index >= self._log_start:
+            # A blank line between the table and the log area
+            return self._get_table_end() + 1 + index - self._log_start, 1
+        index -= HEADER_ROWS - 1
+        return HEADER_ROWS + 1 + index // COLUMNS, 1 + (index % COLUMNS) * CELL_WIDTH
+
+
+    def render(self) -> None:
+        """
+        Rewrites the cells whose text changed since the last render.
+        Returns:
+            None
+        """
+        out = []
+        if self._redraw:
+            self._redraw = False
+            self.cells = [None] * len(self.cells)
+            out.append(CLEAR_SCREEN)
+        for i, cell in enumerate(self._get_cells()):
+            if cell == self.cells[i]:
+                continue
+            self.cells[i] = cell
+            row, column = self._position(i)
+            width = CELL_WIDTH if HEADER_ROWS - 1 <= i < self._log_start else CELL_WIDTH * COLUMNS
+            out.append(f"\x1b[{row};{column}H{cell[:width - 1].ljust(width - 1)}")
+        if out:
+            self.stream.write("".join(out))
+            self.stream.flush()
+
+
+    def _run(self) -> None:
+        if os.name == "nt":
+            # Enables ANSI escape sequences in the Windows console
+            os.system("")
+        self.stream.write(CLEAR_SCREEN + HIDE_CURSOR)
+        while not self._stop.is_set():
+            self.render()
+            self._stop.wait(self.interval)
+        # Log lines of the last interval
+        self.render()
+        rows = self._get_table_end() + 1 + LOG_ROWS
+        self.stream.write(f"\x1b[{rows};1H" + SHOW_CURSOR + "\n")
+        self.stream.flush()
+
+
+    def start(self) -> None:
+        """
+        Starts drawing on a daemon thread. Until stop() only warnings and errors are logged to the console, in the log area.
+        Returns:
+            None
+        """
+        handler = self.console_handler
+        if handler is not None:
+            self._console_level = handler.level
+            handler.setLevel(max(handler.level, CONSOLE_LOG_LEVEL))
+            handler.addFilter(self._on_log_record)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def stop(self) -> None:
+        """
+        Stops drawing and moves the cursor below the log area.
+        Returns:
+            None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1)
+        handler = self.console_handler
+        if handler is not None and self._console_level is not None:
+            handler.removeFilter(self._on_log_record)
+            handler.setLevel(self._console_level)
+            self._console_level = None
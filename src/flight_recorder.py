@@ -0,0 +1,288 @@
+"""
+Flight recorder writing the inputs and emitted OSC messages of every tick into a binary ring file through a memory map.
+
+File layout (little endian):
+    header      HEADER (magic, version, record size, capacity, records written, wall clock and monotonic time at start), padded to HEADER_SIZE
+    names       NAMES_SIZE bytes of null terminated UTF-8 names, the id of a name is its position in this list
+    records     capacity fixed size RECORDs (monotonic time, kind, component, name id, value), oldest overwritten first
+
+Run this module to decode a recording:
+    python flight_recorder.py flight.rec [--kind message] [--parameter Curl] [--dump]
+"""
+import argparse
+import fnmatch
+import logging
+import mmap
+import struct
+import sys
+import time
+from threading import Lock
+
+MAGIC = b"TPFR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQdd")
+HEADER_SIZE = 64
+NAMES_SIZE = 64 * 1024
+RECORD = struct.Struct("<dBBHf")
+DEFAULT_CAPACITY = 1 << 20 # 16 MiB of records
+
+KIND_TICK = 0 # value: duration of the tick in seconds
+KIND_INPUT = 1 # value: value of an action that changed, component: index of a vector2 component
+KIND_MESSAGE = 2 # value: value of an OSC message that was emitted
+KIND_NAMES = ("tick", "input", "message")
+TICK_NAME = "tick"
+
+
+class FlightRecorder:
+    """
+    Records changed action values, emitted OSC messages and tick durations into a ring file.
+    Recording a value is a dict lookup and a struct.pack_into into the memory map, so it can stay enabled.
+    """
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.records_offset = HEADER_SIZE + NAMES_SIZE
+        size = self.records_offset + capacity * RECORD.size
+        with open(path, "wb") as f:
+            f.truncate(size)
+        self.file = open(path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.ids = {}
+        self.names_length = 0
+        self.written = 0
+        self.tick_start = 0.0
+        self.watched = []
+        self.closed = False
+        self._lock = Lock()
+        self._write_header(time.time(), time.monotonic())
+        self.get_id(TICK_NAME)
+        logging.info(f"Flight recorder writing to {path} ({capacity} records)")
+
+
+    def _write_header(self, wall_time: float, monotonic_time: float) -> None:
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD.size, self.capacity, self.written, wall_time, monotonic_time)
+
+
+    def get_id(self, name: str) -> int:
+        """
+        Gets the id of a name, adding it to the name table of the file if it is new.
+        Parameters:
+            name (str): Name of an action or parameter
+        Returns:
+            int: Id of the name
+        """
+        id = self.ids.get(name)
+        if id is not None:
+            return id
+        encoded = name.encode("utf-8") + b"\x00"
+        if self.names_length + len(encoded) > NAMES_SIZE or len(self.ids) >= 0xFFFF:
+            logging.warning(f"Flight recorder name table is full, not recording {name}")
+            self.ids[name] = id = 0xFFFF
+            return id
+        offset = HEADER_SIZE + self.names_length
+        self.map[offset:offset + len(encoded)] = encoded
+        self.names_length += len(encoded)
+        self.ids[name] = id = len(self.ids)
+        return id
+
+
+    def record(self, t: float, kind: int, id: int, value: float, component: int = 0) -> None:
+        """
+        Writes a record, overwriting the oldest one if the ring is full.
+        Parameters:
+            t (float): Monotonic time
+            kind (int): Kind of the record (KIND_*)
+            id (int): Id of the name
+            value (float): Value
+            component (int): Component of a vector value
+        Returns:
+            None
+        """
+        with self._lock:
+            if self.closed:
+                return
+            RECORD.pack_into(self.map, self.records_offset + (self.written % self.capacity) * RECORD.size, t, kind, component, id, value)
+            self.written += 1
+
+
+    def record_message(self, parameter: str, value) -> None:
+        """
+        Records an emitted OSC message.
+        Parameters:
+            parameter (str): Name of the parameter
+            value (any): Value of the parameter
+        Returns:
+            None
+        """
+        id = self.ids.get(parameter)
+        if id is None:
+            # Messages can be sent from the OSC server thread when the avatar changes
+            with self._lock:
+                id = self.get_id(parameter)
+        self.record(time.monotonic(), KIND_MESSAGE, id, value)
+
+
+    def watch(self, actions: list) -> None:
+        """
+        Sets the compiled actions whose values are recorded when they change. Skeleton actions are only recorded as messages.
+        Parameters:
+            actions (list): Compiled actions
+        Returns:
+            None
+        """
+        self.watched = [[action, self.get_id(action.name), None] for action in actions if action.type != "skeleton"]
+
+
+    def begin_tick(self) -> None:
+        """
+        Marks the start of a tick.
+        Returns:
+            None
+        """
+        self.tick_start = time.monotonic()
+
+
+    def end_tick(self) -> None:
+        """
+        Records the values of the watched actions that changed during the tick and the duration of the tick.
+        Returns:
+            None
+        """
+        t = self.tick_start
+        for entry in self.watched:
+            value = entry[0].value
+            if value == entry[2]:
+                continue
+            last_value = entry[2]
+            entry[2] = value
+            if isinstance(value, tuple):
+                for i in range(len(value)):
+                    if last_value is None or value[i] != last_value[i]:
+                        self.record(t, KIND_INPUT, entry[1], value[i], i)
+            elif value is not None:
+                self.record(t, KIND_INPUT, entry[1], value)
+        self.record(t, KIND_TICK, 0, time.monotonic() - t)
+        with self._lock:
+            if not self.closed:
+                struct.pack_into("<Q", self.map, 12, self.written)
+
+
+    def close(self) -> None:
+        """
+        Writes the record count and closes the file. Closing a closed recorder does nothing.
+        Returns:
+            None
+        """
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            struct.pack_into("<Q", self.map, 12, self.written)
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+        logging.info(f"Flight recorder wrote {self.written} records to {self.path}")
+
+
+def read_recording(path: str) -> tuple[dict, list, list]:
+    """
+    Reads a recording.
+    Parameters:
+        path (str): Path of the recording
+    Returns:
+        tuple: Header values, names by id and records as (time, kind, component, id, value) ordered from oldest to newest
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, record_size, capacity, written, wall_time, monotonic_time = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a flight recording")
+    names = [name.decode("utf-8") for name in data[HEADER_SIZE:HEADER_SIZE + NAMES_SIZE].split(b"\x00")]
+    offset = HEADER_SIZE + NAMES_SIZE
+    records = list(RECORD.iter_unpack(data[offset:offset + min(written, capacity) * RECORD.size]))
+    if written > capacity:
+        start = written % capacity
+        records = records[start:] + records[:start]
+    header = {"capacity": capacity, "written": written, "wall_time": wall_time, "monotonic_time": monotonic_time}
+    return header, names, records
+
+
+def summarize(names: list, records: list) -> dict:
+    """
+    Summarizes records per name and kind.
+    Parameters:
+        names (list): Names by id
+        records (list): Records as returned by read_recording
+    Returns:
+        dict: Count, rate in Hz, largest gap and last value by (kind, name)
+    """
+    stats = {}
+    for t, kind, component, id, value in records:
+        name = names[id] if id < len(names) else f"#{id}"
+        if component:
+            name += f"[{component}]"
+        entry = stats.get((kind, name))
+        if entry is None:
+            stats[(kind, name)] = entry = {"count": 0, "first": t, "last": t, "max_gap": 0.0, "value": value}
+        entry["max_gap"] = max(entry["max_gap"], t - entry["last"])
+        entry["count"] += 1
+        entry["last"] = t
+        entry["value"] = value
+    for entry in stats.values():
+        duration = entry["last"] - entry["first"]
+        entry["rate"] = (entry["count"] - 1) / duration if duration > 0 else 0.0
+    return stats
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Decodes a ThumbParamsOSC flight recording")
+    parser.add_argument("path", type=str, help="path of the recording")
+    parser.add_argument("-k", "--kind", type=str, choices=KIND_NAMES, help="only show records of this kind")
+    parser.add_argument("-p", "--parameter", type=str, help="only show names matching this pattern (wildcards allowed)")
+    parser.add_argument("-s", "--since", type=float, default=0.0, help="only show the last SINCE seconds of the recording")
+    parser.add_argument("-d", "--dump", action="store_true", help="print every record instead of a summary")
+    args = parser.parse_args(argv)
+
+    header, names, records = read_recording(args.path)
+    if not records:
+        print("Empty recording.")
+        return
+    # Inputs carry the start time of their tick, so records are only roughly ordered by time
+    start = min(record[0] for record in records)
+    end = max(record[0] for record in records)
+    pattern = args.parameter if args.parameter is None or any(c in args.parameter for c in "*?[") else f"*{args.parameter}*"
+    kind = KIND_NAMES.index(args.kind) if args.kind else None
+
+    def selected(record) -> bool:
+        t, record_kind, _, id, _ = record
+        if kind is not None and record_kind != kind:
+            return False
+        if args.since and t < end - args.since:
+            return False
+        return pattern is None or fnmatch.fnmatchcase(names[id] if id < len(names) else "", pattern)
+
+    records = [record for record in records if selected(record)]
+    wall_start = header["wall_time"] - header["monotonic_time"]
+    print(f"{header['written']} records written, {len(records)} selected, {end - start:.3f}s recorded, ending {time.strftime('%d-%b-%y %H:%M:%S', time.localtime(wall_start + end))}")
+
+    if args.dump:
+        for t, record_kind, component, id, value in records:
+            name = names[id] if id < len(names) else f"#{id}"
+            print(f"{t - start:12.6f}  {KIND_NAMES[record_kind].ljust(7)}  {name}{f'[{component}]' if component else ''} = {value:g}")
+        return
+
+    stats = summarize(names, records)
+    ticks = stats.get((KIND_TICK, TICK_NAME))
+    if ticks is not None:
+        durations = [value for _, record_kind, _, _, value in records if record_kind == KIND_TICK]
+        print(f"Ticks: {ticks['count']} at {ticks['rate']:.1f} Hz, largest gap {ticks['max_gap'] * 1000:.2f}ms, duration avg {sum(durations) / len(durations) * 1e6:.0f}us max {max(durations) * 1e6:.0f}us")
+    print(f"{'kind'.ljust(8)}{'name'.ljust(60)}{'count'.rjust(8)}{'rate Hz'.rjust(10)}{'max gap s'.rjust(11)}{'last'.rjust(10)}")
+    for (record_kind, name), entry in sorted(stats.items()):
+        if record_kind == KIND_TICK:
+            continue
+        print(f"{KIND_NAMES[record_kind].ljust(8)}{name.ljust(60)}{entry['count']:8d}{entry['rate']:10.2f}{entry['max_gap']:11.3f}{entry['value']:10.4g}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
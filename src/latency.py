@@ -0,0 +1,141 @@
+import logging
+import time
+
+# 32 sub-buckets per power of two, values are kept with about 3% precision
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Values from 0 up to 2^40 ns (about 18 minutes) can be recorded, larger ones are clamped
+MAX_VALUE_BITS = 40
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """
+    HDR style histogram of durations in nanoseconds with log-linear buckets:
+    values below 2 * SUB_BUCKETS get a bucket each, above that every power of two is split into SUB_BUCKETS buckets.
+    Recording is a bit_length, a shift and a list increment.
+    """
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * ((MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKETS + 2 * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        """
+        Records a duration.
+        Parameters:
+            value (int): Duration in nanoseconds
+        Returns:
+            None
+        """
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value < 2 * SUB_BUCKETS:
+            self.counts[value if value > 0 else 0] += 1
+            return
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        index = shift * SUB_BUCKETS + (value >> shift)
+        self.counts[min(index, len(self.counts) - 1)] += 1
+
+    @staticmethod
+    def _bucket_value(index: int) -> int:
+        if index < 2 * SUB_BUCKETS:
+            return index
+        shift = index // SUB_BUCKETS - 1
+        sub_bucket = index - shift * SUB_BUCKETS
+        # Middle of the bucket
+        return (sub_bucket << shift) + (1 << shift) // 2
+
+    def percentile(self, percentile: float) -> int:
+        """
+        Gets the value below which the given percentage of the recorded durations fall.
+        Parameters:
+            percentile (float): Percentile between 0 and 100
+        Returns:
+            int: Duration in nanoseconds
+        """
+        if self.count == 0:
+            return 0
+        threshold = max(1, int(self.count * percentile / 100 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def reset(self) -> None:
+        """
+        Clears the histogram.
+        Returns:
+            None
+        """
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = self.total = self.max = 0
+
+
+class LatencyProfiler:
+    """
+    A latency histogram per stage of a tick. Percentiles are logged every report_interval seconds and on shutdown.
+    Periodic reports cover the time since the last report, the shutdown report covers the whole run.
+    """
+
+    def __init__(self, stages: tuple, report_interval: float = 60.0, clock=time.monotonic) -> None:
+        self.stages = {stage: LatencyHistogram() for stage in stages}
+        self.totals = {stage: LatencyHistogram() for stage in stages}
+        self.report_interval = report_interval
+        self.clock = clock
+        self.last_report = clock()
+
+    def record(self, stage: str, value: int) -> None:
+        """
+        Records the duration of a stage.
+        Parameters:
+            stage (str): Name of the stage
+            value (int): Duration in nanoseconds
+        Returns:
+            None
+        """
+        self.stages[stage].record(value)
+        self.totals[stage].record(value)
+
+    def maybe_report(self) -> None:
+        """
+        Logs and resets the percentiles if report_interval has passed since the last report.
+        Returns:
+            None
+        """
+        if self.report_interval <= 0 or self.clock() - self.last_report < self.report_interval:
+            return
+        self.last_report = self.clock()
+        self.log_stats(self.stages, f"last {self.report_interval:g}s")
+        for histogram in self.stages.values():
+            histogram.reset()
+
+    def log_stats(self, histograms: dict | None = None, title: str = "total") -> None:
+        """
+        Logs count, mean, percentiles and maximum of every stage in microseconds.
+        Parameters:
+            histograms (dict | None): Histograms by stage, None for the totals of the whole run
+            title (str): Title of the report
+        Returns:
+            None
+        """
+        histograms = self.totals if histograms is None else histograms
+        logging.info(f"Tick latency ({title}, us):")
+        logging.info(f"  {'stage'.ljust(16)}{'n'.rjust(10)}{'mean'.rjust(10)}" + "".join(f"p{p:g}".rjust(10) for p in PERCENTILES) + "max".rjust(10))
+        for stage, histogram in histograms.items():
+            if histogram.count == 0:
+                continue
+            percentiles = "".join(f"{histogram.percentile(p) / 1000:10.1f}" for p in PERCENTILES)
+            logging.info(f"  {stage.ljust(16)}{histogram.count:10d}{histogram.mean / 1000:10.1f}{percentiles}{histogram.max / 1000:10.1f}")
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import ctypes
 import json
 import logging
@@ -8,14 +9,20 @@ import time
 import traceback
 import glob
 import shutil
-from tray_icon import TrayIcon
-from threading import Thread
+import openvr
+from threading import Thread, Lock
 
 from zeroconf._exceptions import NonUniqueNameException
 
 from osc import OSC
-from ovr import OVR
-from xbox_controller import XboxController
+from actions import compile_actions, get_steps, get_stage_steps
+from scheduler import TickScheduler
+from tick import run_tick
+from flight_recorder import FlightRecorder, DEFAULT_CAPACITY
+from latency import LatencyProfiler
+from metrics import Metrics, METRICS_PATH
+from debug_renderer import DebugRenderer
+from async_engine import AsyncEngine
 
 
 def get_absolute_path(relative_path) -> str:
@@ -30,106 +37,109 @@ def get_absolute_path(relative_path) -> str:
     return os.path.join(base_path, relative_path)
 
 
-def print_debugoutput() -> None:
+def rebuild_steps() -> None:
     """
-    Prints the debugoutput string.
+    Rebuilds the steps of a tick for the parameters of the current avatar.
+    Actions that are sent again start over with no value, so their current value is sent with the next tick
+    even if it did not change since they were left out.
     Returns:
         None
     """
-    index = 0
-    _debugoutput = ""
-    os.system('cls' if os.name == 'nt' else 'clear')
-
-    def get_debug_string(parameter, value, floating="", always = 0) -> str:
-        nonlocal index
-        if isinstance(value, float):
-            value = f"{value:.4f}"
-
-        if floating != "" and float(floating) > 0:
-            floating = f"Floating: {floating}s"
-        else:
-            floating = ""
-        match always:
-            case 0:
-                always = "SOC"
-            case 1:
-                always = "SOP"
+    global steps, steps_by_stage
+
+    old_steps = set(steps)
+    new_steps = get_steps(actions, osc.is_on_avatar)
+    for step in new_steps:
+        if step not in old_steps:
+            step.__self__.value = None
+    # Rebinding is atomic, the main loop picks up the new steps with the next tick
+    steps = new_steps
+    if steps_by_stage:
+        steps_by_stage = get_stage_steps(actions, osc.is_on_avatar)
+
+
+def apply_avatar(avatar_id, parameters) -> None:
+    """
+    Switches to a new avatar and resends all parameters to it.
+    Parameters:
+        avatar_id (str): Avatar ID
+        parameters (set | None): Parameters of the avatar, None to send every parameter
+    Returns:
+        None
+    """
+    if osc.filter_avatar_parameters:
+        osc.avatar_parameters = parameters
+        rebuild_steps()
+    osc.curr_avatar = avatar_id
+    if osc.budget is not None:
+        # The new avatar has not received any value yet
+        osc.budget.reset()
+
+    for action in actions:
+        match action.type:
+            case "vector2":
+                for i in range(len(action.osc_parameter)):
+                    if action.enabled[i]:
+                        osc.send_parameter(action.osc_parameter[i], action.last_value[i])
+            case "skeleton":
+                for parameter, value in zip(action.parameters, action.last_value):
+                    osc.send_parameter(parameter, value)
             case _:
-                always = ""
-        
-        res = f"{parameter.ljust(23, ' ')}\t{str(value).ljust(6, ' ')}\t{floating.ljust(10, ' ')}\t{always}\t" + ("\n" if index % 2 == 0 else "")
-        index += 1
-        return res
-
-    if config["ControllerType"]["enabled"]:
-        _debugoutput += get_debug_string("ControllerType", config["ControllerType"]["last_value"], "", config["ControllerType"]["always"])
-    if config["LeftThumb"]["enabled"]:
-        _debugoutput += get_debug_string("LeftThumb", config["LeftThumb"]["last_value"], "", config["LeftThumb"]["always"])
-    if config["RightThumb"]["enabled"]:
-        _debugoutput += get_debug_string("RightThumb", config["RightThumb"]["last_value"], "", config["RightThumb"]["always"])
-    if config["LeftABButtons"]["enabled"]:
-        _debugoutput += get_debug_string("LeftABButtons", config["LeftABButtons"]["last_value"], "", config["LeftABButtons"]["always"])
-    if config["RightABButtons"]["enabled"]:
-        _debugoutput += get_debug_string("RightABButtons", config["RightABButtons"]["last_value"], "", config["RightABButtons"]["always"])
+                if action.enabled:
+                    osc.send_parameter(action.osc_parameter, action.last_value)
+    osc.flush()
 
-    for action in config["actions"]:
-        if action["enabled"]:
-            if action["type"] == "vector2":
-                _debugoutput += get_debug_string(action["osc_parameter"][0], action["last_value"][0], action["floating"][0], action["always"][0])
-                _debugoutput += get_debug_string(action["osc_parameter"][1], action["last_value"][1], action["floating"][1], action["always"][1])
-                if len(action["osc_parameter"]) > 2:
-                    _debugoutput += get_debug_string(action["osc_parameter"][2], action["last_value"][2], action["floating"][2], action["always"][2])
-            else:
-                _debugoutput += get_debug_string(action["osc_parameter"], action["last_value"], action["floating"], action["always"])
-
-    for action in config["xinput_actions"]:
-        if action["enabled"]:
-            if action["type"] == "vector2":
-                _debugoutput += get_debug_string(action["osc_parameter"][0], action["last_value"][0], action["floating"][0], action["always"][0])
-                _debugoutput += get_debug_string(action["osc_parameter"][1], action["last_value"][1], action["floating"][1], action["always"][1])
-                if len(action["osc_parameter"]) > 2:
-                    _debugoutput += get_debug_string(action["osc_parameter"][2], action["last_value"][2], action["floating"][2], action["always"][2])
-            else:
-                _debugoutput += get_debug_string(action["osc_parameter"], action["last_value"], action["floating"], action["always"])
-
-    print(_debugoutput)
+
+def apply_latest_avatar(avatar_id, parameters) -> None:
+    """
+    Applies an avatar unless another avatar change came in while its parameters were queried.
+    Parameters:
+        avatar_id (str): Avatar ID
+        parameters (set | None): Parameters of the avatar, None to send every parameter
+    Returns:
+        None
+    """
+    with avatar_lock:
+        if avatar_id != requested_avatar:
+            logging.info(f"Dropping the parameters of {avatar_id}, the avatar changed again")
+            return
+        apply_avatar(avatar_id, parameters)
 
 
 def resend_parameters(avatar_id) -> None:
     """
-    Resends all parameters to the new avatar.
+    Resends all parameters to the new avatar, after querying which parameters it has.
+    With the asyncio engine the query runs in an executor, so it doesn't hold up the ticks on the event loop.
+    Changes can overlap, the threaded server handles each on its own thread, so only the latest one is applied.
     Parameters:
         avatar_id (str): Avatar ID
     Returns:
         None
     """
-    global osc
+    global requested_avatar
+    with avatar_lock:
+        requested_avatar = avatar_id
+        if osc.curr_avatar == avatar_id:
+            return
 
-    if osc.curr_avatar == avatar_id:
+    logging.info(f"Resending parameters to {avatar_id}")
+    if not osc.filter_avatar_parameters or osc.qclient is None:
+        apply_latest_avatar(avatar_id, None)
         return
 
-    logging.info(f"Resending parameters to {avatar_id}")
-    osc.curr_avatar = avatar_id
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None:
+        apply_latest_avatar(avatar_id, osc.query_avatar_parameters())
+        return
 
-    if config["ControllerType"]["enabled"]:
-        osc.send_parameter("ControllerType", config["ControllerType"]["last_value"])
-    if config["LeftThumb"]["enabled"]:
-        osc.send_parameter("LeftThumb", config["LeftThumb"]["last_value"])
-    if config["RightThumb"]["enabled"]:
-        osc.send_parameter("RightThumb", config["RightThumb"]["last_value"])
-    if config["LeftABButtons"]["enabled"]:
-        osc.send_parameter("LeftABButtons", config["LeftABButtons"]["last_value"])
-    if config["RightABButtons"]["enabled"]:
-        osc.send_parameter("RightABButtons", config["RightABButtons"]["last_value"])
+    def on_queried(future) -> None:
+        parameters = None if future.cancelled() or future.exception() is not None else future.result()
+        apply_latest_avatar(avatar_id, parameters)
 
-    for action in config["actions"]:
-        if action["type"] == "vector2":
-            osc.send_parameter(action["osc_parameter"][0], action["last_value"][0])
-            osc.send_parameter(action["osc_parameter"][1], action["last_value"][1])
-            if len(action["osc_parameter"]) > 2:
-                osc.send_parameter(action["osc_parameter"][2], action["last_value"][2])
-            continue
-        osc.send_parameter(action["osc_parameter"], action["last_value"])
+    loop.run_in_executor(None, osc.query_avatar_parameters).add_done_callback(on_queried)
 
 
 def handle_input() -> None:
@@ -138,50 +148,78 @@ def handle_input() -> None:
     Returns:
         None
     """
-    ovr.poll_next_events()
+    run_tick(ovr, osc, steps, recorder)
+
+
+def on_quit(event: openvr.VREvent_t) -> None:
+    """
+    Stops the main loop when SteamVR asks the application to quit.
+    Parameters:
+        event (openvr.VREvent_t): Quit event
+    Returns:
+        None
+    """
+    logging.info("SteamVR is quitting, stopping...")
+    ovr.acknowledge_quit()
+    scheduler.stop()
+
+
+def on_device_changed(event: openvr.VREvent_t) -> None:
+    """
+    Logs tracked devices being connected and disconnected.
+    Parameters:
+        event (openvr.VREvent_t): TrackedDeviceActivated or TrackedDeviceDeactivated event
+    Returns:
+        None
+    """
+    state = "connected" if event.eventType == openvr.VREvent_TrackedDeviceActivated else "disconnected"
+    logging.info(f"Tracked device {event.trackedDeviceIndex} {state}, controller type: {ovr.get_controllertype()}")
+
+
+def handle_input_profiled() -> None:
+    """
+    Handles SteamVR input and sends it to VRChat, recording the duration of every stage of the tick.
+    Returns:
+        None
+    """
+    clock = time.perf_counter_ns
+    record = profiler.record
+    if recorder is not None:
+        recorder.begin_tick()
+    start = t = clock()
+    ovr.drain_events()
+    t, t0 = clock(), t
+    record("events", t - t0)
+    ovr.update_action_state()
+    t, t0 = clock(), t
+    record("action_state", t - t0)
     osc.refresh_time()
+    osc.run_timers()
+    t, t0 = clock(), t
+    record("timers", t - t0)
 
-    if config["ControllerType"]["enabled"] and (osc.curr_time - config["ControllerType"]["timestamp"] > 10.0 or config["ControllerType"]["always"]):
-        _controller_type = ovr.get_controllertype()
-        if _controller_type == 0 and xinput.is_plugged:
-            _controller_type = 10
-        elif _controller_type != 0 and xinput.is_plugged:
-            _controller_type += 10
-        osc.send("ControllerType", _controller_type)
-
-    lefthandskeleton = ovr.get_value(config["actions"][0])
-    osc.send(config["actions"][0], lefthandskeleton)
-
-    righthandskeleton = ovr.get_value(config["actions"][1])
-    osc.send(config["actions"][1], righthandskeleton)
-
-    _strinputs = ""
-    for action in config["actions"][2:10]: # Touch Actions
-        val = ovr.get_value(action)
-        _strinputs += "1" if val else "0"
-        osc.send(action, val)
-    osc.send("LeftThumb", _strinputs[:4].rfind("1") + 1)
-    osc.send("RightThumb", _strinputs[4:].rfind("1") + 1)
-    osc.send("LeftABButtons", _strinputs[0] == "1" and _strinputs[1] == "1")
-    osc.send("RightABButtons", _strinputs[4] == "1" and _strinputs[5] == "1")
-
-    for action in config["actions"][10:]:
-        val = ovr.get_value(action)
-        osc.send(action, val)
-
-    # xinput buttons
-    for action in config["xinput_actions"]:
-        val = xinput.get_value(action)
-        osc.send(action, val)
+    for stage, stage_steps in steps_by_stage.items():
+        for step in stage_steps:
+            step()
+        t, t0 = clock(), t
+        record(stage, t - t0)
 
-    if debug:
-        print_debugoutput()
+    osc.flush()
+    t, t0 = clock(), t
+    record("flush", t - t0)
+    record("tick", t - start)
+    if recorder is not None:
+        recorder.end_tick()
 
+    profiler.maybe_report()
 
 def get_server_needed() -> bool:
     """
     Checks if the OSC server is needed.
+    Filtering by avatar parameters needs it too, the avatar changes arrive through it.
     """
+    if config.get("FilterAvatarParameters", True):
+        return True
     if config["ControllerType"]["enabled"] and not config["ControllerType"]["always"]:
         return True
     if config["LeftThumb"]["enabled"] and not config["LeftThumb"]["always"]:
@@ -204,42 +242,103 @@ def get_server_needed() -> bool:
     return False
 
 
+def on_tray_exit() -> None:
+    """
+    Stops the main loop when Exit is clicked in the tray. Runs on the tray thread,
+    so the teardown is left to the main thread, which can't be in the middle of a tick once the loop returned.
+    Returns:
+        None
+    """
+    global exit_requested
+    logging.info("Exit clicked in the tray, stopping...")
+    exit_requested = True
+    if scheduler is not None:
+        scheduler.stop()
+
+
 def stop() -> None:
     """
-    Stops the program.
+    Stops the program. Must run on the main thread, outside of a tick.
     Returns:
         None
     """
+    global stopped
+    if stopped:
+        return
+    stopped = True
     xinput.running = False
-    tray.stop()
+    scheduler.stop()
+    if renderer is not None:
+        renderer.stop()
+    scheduler.log_stats()
+    logging.info(osc.get_filter_savings())
+    if osc.budget is not None:
+        osc.budget.log_stats()
+    if tray is not None:
+        tray.stop()
     ovr.shutdown()
     osc.shutdown()
+    if recorder is not None:
+        recorder.close()
+    if profiler is not None:
+        profiler.log_stats()
 
-logging.basicConfig(level=logging.DEBUG if len(sys.argv) > 1 else logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S', handlers=[logging.StreamHandler(), logging.FileHandler(get_absolute_path("log.log"))])
+console_handler = logging.StreamHandler()
+logging.basicConfig(level=logging.DEBUG if len(sys.argv) > 1 else logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S', handlers=[console_handler, logging.FileHandler(get_absolute_path("log.log"))])
 
 VERSION = open(get_absolute_path("VERSION")).read().strip()
 
-tray = TrayIcon(stop, get_absolute_path("icon.ico"))
-tray.run()
-
 # Argument Parser
 parser = argparse.ArgumentParser(description='ThumbParamsOSC: Takes button data from SteamVR and sends it to an OSC-Client')
 parser.add_argument('-d', '--debug', required=False, action='store_true', help='prints values for debugging')
 parser.add_argument('-i', '--ip', required=False, type=str, help="set OSC ip. Default=127.0.0.1")
 parser.add_argument('-p', '--port', required=False, type=str, help="set OSC port. Default=9000")
+parser.add_argument('-e', '--engine', required=False, type=str, choices=["threaded", "asyncio"], help="set OSC I/O engine. Default=threaded")
+parser.add_argument('-r', '--replay', required=False, type=str, help="replay an input trace file instead of reading SteamVR and XInput, 'synthetic' to generate one")
+parser.add_argument('--replay-speed', required=False, type=float, default=1.0, help="set replay speed, 0 for unthrottled. Default=1.0")
+parser.add_argument('--record', required=False, type=str, help="write a flight recording of inputs and OSC messages to this file")
+parser.add_argument('-l', '--latency', required=False, action='store_true', help="log latency percentiles of every stage of a tick")
+parser.add_argument('-m', '--metrics-port', required=False, type=int, help="serve metrics on this port if the OSCQuery server is not running")
 ip = None
 port = None
 debug = False
+engine = None
+replay = None
+replay_speed = 1.0
+record = None
+latency = False
+metrics_port = None
 try:
     args = parser.parse_args()
     ip = args.ip
     port = args.port
     debug = args.debug
+    engine = args.engine
+    replay = args.replay
+    replay_speed = args.replay_speed
+    record = args.record
+    latency = args.latency
+    metrics_port = args.metrics_port
 except Exception as e:
     logging.error("Argument Error, continuing without arguments")
     ip = None
     port = None
     debug = False
+    engine = None
+    replay = None
+    replay_speed = 1.0
+    record = None
+    latency = False
+    metrics_port = None
+
+tray = None
+scheduler = None
+stopped = False
+exit_requested = False
+if replay is None:
+    from tray_icon import TrayIcon
+    tray = TrayIcon(on_tray_exit, get_absolute_path("icon.ico"))
+    tray.run()
 
 if os.name == 'nt':
     try:
@@ -251,12 +350,29 @@ CONFIG_PATH = get_absolute_path('config.json')
 MANIFEST_PATH = get_absolute_path("app.vrmanifest")
 FIRST_LAUNCH_FILE = get_absolute_path("bindings/first_launch")
 config: dict = json.load(open(CONFIG_PATH))
+actions: list = []
+steps: list = []
+recorder = None
+profiler = None
+renderer = None
+steps_by_stage: dict = {}
+# The avatar of the latest change, queries for an avatar that was switched away from meanwhile are dropped
+requested_avatar = None
+avatar_lock = Lock()
 config["IP"] = ip if ip else config["IP"]
 config["Port"] = port if port else config["Port"]
+engine = engine if engine else config.get("OSC_Engine", "threaded")
 POLLINGRATE = 1 / float(config['PollingRate'])
+# An unthrottled replay runs the ticks back to back
+tick_period = 0.0 if replay is not None and replay_speed <= 0 else POLLINGRATE
+try:
+    scheduler = TickScheduler(tick_period, config.get("OverrunPolicy", "skip"))
+except (ValueError, AttributeError) as e:
+    logging.warning(f"Invalid OverrunPolicy in config.json ({e}), falling back to skip")
+    scheduler = TickScheduler(tick_period, "skip")
 
 try:
-    if os.path.isfile(FIRST_LAUNCH_FILE):
+    if replay is None and os.path.isfile(FIRST_LAUNCH_FILE):
         if os.name == "nt":
             ctypes.windll.user32.MessageBoxW(0, "ThumbParamsOSC is now running and has registered as an Overlay on Steam.\nIt will now open automatically with SteamVR\nOpen Configurator.exe to change sent Parameters and other Settings if you havent yet.\n.This is only shown once.", "ThumbparamsOSC", 0)
         logging.info("First Launch, deleting OSC cache. Registering app to run on SteamVR start...")
@@ -269,9 +385,43 @@ except Exception as e:
     logging.error(traceback.format_exc())
 
 try:
-    ovr: OVR = OVR(config, CONFIG_PATH, MANIFEST_PATH, FIRST_LAUNCH_FILE)
-    osc: OSC = OSC(config, lambda addr, value: resend_parameters(value), get_server_needed())
-    xinput = XboxController(polling_rate=config.get("XInputPollingRate", 1000))
+    if replay is not None:
+        # Imported here, so a replay runs without SteamVR and XInput
+        from replay import ReplayOVR, ReplayXboxController, load_trace, synthetic_trace, SYNTHETIC
+        xinput = ReplayXboxController()
+        ovr = ReplayOVR(synthetic_trace(config) if replay == SYNTHETIC else load_trace(replay), replay_speed, xinput)
+    else:
+        from ovr import OVR
+        from xbox_controller import XboxController
+        ovr = OVR(config, CONFIG_PATH, MANIFEST_PATH, FIRST_LAUNCH_FILE)
+        xinput = XboxController(polling_rate=config.get("XInputPollingRate", 1000))
+    # A replay runs without VRChat, the server would wait for it forever
+    osc: OSC = OSC(config, lambda addr, value: resend_parameters(value), replay is None and get_server_needed(), engine)
+    ovr.events.subscribe(openvr.VREvent_Quit, on_quit)
+    ovr.events.subscribe(openvr.VREvent_DriverRequestedQuit, on_quit)
+    ovr.events.subscribe(openvr.VREvent_TrackedDeviceActivated, on_device_changed)
+    ovr.events.subscribe(openvr.VREvent_TrackedDeviceDeactivated, on_device_changed)
+    ovr.events.subscribe(openvr.VREvent_EnterStandbyMode, lambda event: logging.info("SteamVR entered standby."))
+    ovr.events.subscribe(openvr.VREvent_LeaveStandbyMode, lambda event: logging.info("SteamVR left standby."))
+    actions = compile_actions(config, ovr, xinput, osc)
+    steps = get_steps(actions, osc.is_on_avatar)
+    record = record if record else config.get("FlightRecorder") or None
+    if record:
+        recorder = FlightRecorder(get_absolute_path(record), int(config.get("FlightRecorderSize", DEFAULT_CAPACITY)))
+        recorder.watch(actions)
+        osc.recorder = recorder
+    if debug:
+        renderer = DebugRenderer(actions, osc, float(config.get("DebugRefreshRate", 10.0)), console_handler=console_handler)
+    metrics = Metrics(osc, scheduler, xinput)
+    metrics_port = metrics_port if metrics_port else int(config.get("MetricsPort", 0))
+    if osc.oscqs is not None:
+        metrics.register(osc.oscqs)
+        logging.info(f"Serving metrics on http://127.0.0.1:{osc.http_port}{METRICS_PATH}")
+    elif metrics_port > 0:
+        metrics.serve(metrics_port)
+    if latency:
+        steps_by_stage = get_stage_steps(actions, osc.is_on_avatar)
+        profiler = LatencyProfiler(("events", "action_state", "timers", *steps_by_stage, "flush", "tick"), float(config.get("LatencyReportInterval", 60.0)))
 except OSError as e:
     logging.error("You can only bind to the port 9001 once.")
     logging.error(traceback.format_exc())
@@ -293,22 +443,33 @@ logging.info(f"IP: {osc.ip}")
 logging.info(f"Port: {osc.port}")
 logging.info(f"Server Port: {osc.server_port}")
 logging.info(f"HTTP Port: {osc.http_port}")
-logging.info(f"PollingRate: {POLLINGRATE}s ({config['PollingRate']} Hz)")
+logging.info(f"Engine: {engine}")
+if scheduler.period > 0:
+    logging.info(f"PollingRate: {POLLINGRATE}s ({config['PollingRate']} Hz, on overrun: {scheduler.overrun_policy})")
+else:
+    logging.info("PollingRate: unthrottled")
 logging.info(f"StickMoveTolerance: {osc.stick_tolerance} ({config['StickMoveTolerance']}%)")
+if osc.budget is not None:
+    logging.info(f"Bandwidth budget: {osc.budget.rate:g} messages/s")
 logging.info("Open Configurator.exe to change sent Parameters and other Settings.")
 
 
 def main_loop():
     # Main Loop
-    while True:
-        handle_input()
-        time.sleep(POLLINGRATE)
+    tick = handle_input_profiled if profiler is not None else handle_input
+    if engine == "asyncio":
+        asyncio.run(AsyncEngine(osc, scheduler).run(tick))
+    else:
+        scheduler.run(tick)
 
 
 try:
     thread = Thread(target=xinput.polling_loop, daemon=True)
     thread.start()
-    main_loop()
+    if renderer is not None:
+        renderer.start()
+    if not exit_requested:
+        main_loop()
 except KeyboardInterrupt:
     pass
 except Exception:
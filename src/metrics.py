@@ -0,0 +1,165 @@
+import json
+import logging
+import threading
+import time
+
+from tinyoscquery.queryservice import OSCQueryHTTPServer, OSCQueryHTTPHandler
+from tinyoscquery.shared.node import OSCQueryNode, OSCHostInfo
+
+METRICS_PATH = "/metrics"
+METRICS_JSON_PATH = "/metrics.json"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "thumbparams_"
+# Rates are computed over at least this many seconds, scrapes in between get the previous rates
+MIN_RATE_INTERVAL = 1.0
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Collects runtime metrics from the OSC client, the tick scheduler and the XInput controller
+    and renders them as JSON or in the Prometheus text format.
+    Counters are read without locking, a scrape can be off by the messages of the tick it overlaps with.
+    """
+
+    def __init__(self, osc, scheduler, xinput, clock=time.monotonic) -> None:
+        self.osc = osc
+        self.scheduler = scheduler
+        self.xinput = xinput
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_sample = (clock(), 0, 0, 0)
+        self._rates = (0.0, 0.0, 0.0)
+
+
+    def _get_rates(self) -> tuple:
+        now = self.clock()
+        osc = self.osc
+        with self._lock:
+            last_time, last_messages, last_bytes, last_datagrams = self._last_sample
+            elapsed = now - last_time
+            if elapsed >= MIN_RATE_INTERVAL:
+                self._rates = ((osc.sent_messages - last_messages) / elapsed, (osc.sent_bytes - last_bytes) / elapsed, (osc.sent_datagrams - last_datagrams) / elapsed)
+                self._last_sample = (now, osc.sent_messages, osc.sent_bytes, osc.sent_datagrams)
+            return self._rates
+
+
+    def get_snapshot(self) -> dict:
+        """
+        Gets the current metrics.
+        Returns:
+            dict: Metrics
+        """
+        osc = self.osc
+        messages_per_second, bytes_per_second, datagrams_per_second = self._get_rates()
+        return {
+            "avatar": osc.curr_avatar,
+            "osc": {
+                "messages_sent": osc.sent_messages,
+                "bytes_sent": osc.sent_bytes,
+                "datagrams_sent": osc.sent_datagrams,
+                "messages_per_second": messages_per_second,
+                "bytes_per_second": bytes_per_second,
+                "datagrams_per_second": datagrams_per_second,
+                "messages_filtered": osc.filtered_messages,
+                "bytes_filtered": osc.filtered_bytes,
+                "messages_absent": osc.absent_messages
+            },
+            "budget": osc.budget.get_stats() if osc.budget is not None else None,
+            "scheduler": {
+                "period": self.scheduler.period,
+                "ticks": self.scheduler.ticks,
+                "overruns": self.scheduler.overruns,
+                "skipped_ticks": self.scheduler.skipped_ticks,
+                "effective_rate": self.scheduler.effective_rate
+            },
+            "xinput": {
+                "plugged": bool(self.xinput.is_plugged),
+                "polling_rate": self.xinput.polling_rate,
+                "effective_polling_rate": self.xinput.effective_polling_rate
+            },
+            "parameters": self.osc.get_parameter_counts()
+        }
+
+
+    def to_json(self) -> str:
+        """
+        Renders the current metrics as JSON.
+        Returns:
+            str: JSON document
+        """
+        return json.dumps(self.get_snapshot())
+
+
+    def to_prometheus(self) -> str:
+        """
+        Renders the current metrics in the Prometheus text exposition format.
+        Returns:
+            str: Metrics
+        """
+        snapshot = self.get_snapshot()
+        lines = []
+
+        def metric(name, type_, help, samples):
+            lines.append(f"# HELP {PREFIX}{name} {help}")
+            lines.append(f"# TYPE {PREFIX}{name} {type_}")
+            for labels, value in samples:
+                label_string = ",".join(f"{key}=\"{_escape_label(label)}\"" for key, label in labels.items())
+                lines.append(f"{PREFIX}{name}{{{label_string}}} {value}" if label_string else f"{PREFIX}{name} {value}")
+
+        osc = snapshot["osc"]
+        metric("osc_messages_sent_total", "counter", "OSC messages sent to VRChat.", [({}, osc["messages_sent"])])
+        metric("osc_bytes_sent_total", "counter", "Bytes of OSC messages sent to VRChat.", [({}, osc["bytes_sent"])])
+        metric("osc_datagrams_sent_total", "counter", "UDP datagrams sent to VRChat.", [({}, osc["datagrams_sent"])])
+        metric("osc_messages_per_second", "gauge", "OSC messages sent per second since the previous scrape.", [({}, osc["messages_per_second"])])
+        metric("osc_bytes_per_second", "gauge", "Bytes sent per second since the previous scrape.", [({}, osc["bytes_per_second"])])
+        metric("osc_datagrams_per_second", "gauge", "UDP datagrams sent per second since the previous scrape.", [({}, osc["datagrams_per_second"])])
+        metric("osc_messages_filtered_total", "counter", "OSC messages not sent because of deadband or quantization.", [({}, osc["messages_filtered"])])
+        metric("osc_messages_absent_total", "counter", "OSC messages not sent because the current avatar does not have the parameter.", [({}, osc["messages_absent"])])
+        metric("osc_parameter_messages_sent_total", "counter", "OSC messages sent per parameter.", [({"parameter": parameter}, count) for parameter, count in sorted(snapshot["parameters"].items())])
+        if snapshot["budget"] is not None:
+            metric("budget_messages_total", "counter", "Messages of the bandwidth budget by priority class and outcome.", [
+                ({"class": name, "outcome": outcome}, stats[outcome]) for name, stats in snapshot["budget"].items() for outcome in ("sent", "coalesced", "dropped")
+            ])
+            metric("budget_messages_pending", "gauge", "Messages waiting for a token of the bandwidth budget.", [({"class": name}, stats["pending"]) for name, stats in snapshot["budget"].items()])
+        scheduler = snapshot["scheduler"]
+        metric("ticks_total", "counter", "Ticks of the polling loop.", [({}, scheduler["ticks"])])
+        metric("tick_overruns_total", "counter", "Ticks that finished after the next deadline.", [({}, scheduler["overruns"])])
+        metric("ticks_skipped_total", "counter", "Ticks skipped because of overruns.", [({}, scheduler["skipped_ticks"])])
+        metric("polling_rate_hz", "gauge", "Measured rate of the polling loop.", [({}, scheduler["effective_rate"])])
+        xinput = snapshot["xinput"]
+        metric("xinput_plugged", "gauge", "1 if an XInput controller is connected.", [({}, int(xinput["plugged"]))])
+        metric("xinput_polling_rate_hz", "gauge", "Measured polling rate of the XInput controller.", [({}, xinput["effective_polling_rate"])])
+        metric("avatar_info", "gauge", "Current avatar.", [({"avatar_id": snapshot["avatar"]}, 1)])
+        return "\n".join(lines) + "\n"
+
+
+    def register(self, oscqs) -> None:
+        """
+        Serves the metrics from the HTTP server of an OSCQuery service.
+        Parameters:
+            oscqs (OSCQueryService): OSCQuery service
+        Returns:
+            None
+        """
+        oscqs.add_route(METRICS_PATH, lambda: (PROMETHEUS_CONTENT_TYPE, self.to_prometheus()))
+        oscqs.add_route(METRICS_JSON_PATH, lambda: ("application/json", self.to_json()))
+
+
+    def serve(self, port: int) -> OSCQueryHTTPServer:
+        """
+        Serves the metrics from a HTTP server of their own on localhost, for when there is no OSCQuery service.
+        Parameters:
+            port (int): TCP port
+        Returns:
+            OSCQueryHTTPServer: HTTP server, running on a daemon thread
+        """
+        http_server = OSCQueryHTTPServer(OSCQueryNode("/", description="root node"), OSCHostInfo("ThumbParamsOSC", {}), ("127.0.0.1", port), OSCQueryHTTPHandler)
+        http_server.routes[METRICS_PATH] = lambda: (PROMETHEUS_CONTENT_TYPE, self.to_prometheus())
+        http_server.routes[METRICS_JSON_PATH] = lambda: ("application/json", self.to_json())
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        logging.info(f"Serving metrics on http://127.0.0.1:{port}{METRICS_PATH}")
+        return http_server
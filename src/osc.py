@@ -1,20 +1,32 @@
-from pythonosc import udp_client, dispatcher, osc_server
+from pythonosc import dispatcher, osc_server
 from tinyoscquery.queryservice import OSCQueryService
-from tinyoscquery.utility import get_open_tcp_port, get_open_udp_port, check_if_tcp_port_open, check_if_udp_port_open
+from tinyoscquery.utility import get_open_tcp_port, get_open_udp_port, check_if_tcp_port_open, check_if_udp_port_open, close_zeroconf
 from tinyoscquery.query import OSCQueryBrowser, OSCQueryClient
 import time
 import os
-from threading import Thread
-from psutil import process_iter
+import socket
+import struct
+from threading import Thread, Lock
 import logging
-from ovr import FINGERS, SPLAYFINGERS
+from osc_encoder import OSCMessageTemplate
+from timer_wheel import Timer, TimerWheel
+from bandwidth import BandwidthBudget, PRIORITY_CRITICAL, PRIORITY_ANALOG, PRIORITY_BULK
+from process_watcher import ProcessWatcher, PROCESS_STARTED, PROCESS_EXITED
+from actions import Action, SkeletonAction, SKELETON_SIZE, skeleton_parameters
+import ctypes
 import copy
 
 AVATAR_PARAMETERS_PREFIX = "/avatar/parameters/"
 AVATAR_CHANGE_PARAMETER = "/avatar/change"
+TOGGLE_DEBOUNCE_TIME = 0.1
+# "#bundle" identifier followed by the "immediately" time tag (0x0000000000000001)
+OSC_BUNDLE_HEADER = b"#bundle\x00" + struct.pack(">Q", 1)
+# Largest UDP payload that fits a 1500 byte ethernet frame without IP fragmentation
+DEFAULT_MTU = 1472
+VRCHAT_PROCESS_NAME = "VRChat.exe" if os.name == 'nt' else "VRChat"
 
 class OSC:
-    def __init__(self, conf: dict, avatar_change_function, run_server = True) -> None:
+    def __init__(self, conf: dict, avatar_change_function, run_server = True, engine = "threaded") -> None:
         self.config = conf
         self.ip = conf["IP"]
         self.port = conf["Port"]
@@ -26,15 +38,47 @@ class OSC:
         self.binary_num_bits = int(conf["Binary_bits"])
         self.binary_potencies = [2**i for i in range(self.binary_num_bits)]
         self.binary_potency = (2**self.binary_num_bits) - 1
+        self.engine = engine
         self.server = None
+        self.disp = None
         self.oscqs = None
-        self.osc_client = udp_client.SimpleUDPClient(self.ip, self.port)
+        self.qclient = None
+        self.avatar_change_function = None
+        # Parameters of the current avatar, None if unknown, then every parameter is sent
+        self.avatar_parameters = None
+        self.filter_avatar_parameters = bool(conf.get("FilterAvatarParameters", True))
+        self.absent_messages = 0
+        self.process_watcher = ProcessWatcher(VRCHAT_PROCESS_NAME)
+        self.bundling = bool(conf.get("OSC_Bundling", True))
+        self.mtu = max(int(conf.get("OSC_MTU", DEFAULT_MTU)), len(OSC_BUNDLE_HEADER) + 4)
+        family, _, _, _, self.osc_address = socket.getaddrinfo(self.ip, int(self.port), type=socket.SOCK_DGRAM)[0]
+        self._sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.send_datagram = self._send_datagram
+        self._bundle = bytearray(self.mtu)
+        self._bundle[:len(OSC_BUNDLE_HEADER)] = OSC_BUNDLE_HEADER
+        self._bundle_len = len(OSC_BUNDLE_HEADER)
+        self._bundle_count = 0
+        self._bundle_lock = Lock()
+        self._templates = {}
+        self._priorities = {}
+        self.timers = TimerWheel()
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.sent_datagrams = 0
+        self.filtered_messages = 0
+        self.filtered_bytes = 0
+        self.budget = None
+        self.recorder = None
+        if float(conf.get("OSC_MaxMessagesPerSecond", 0)) > 0:
+            self.budget = BandwidthBudget(float(conf["OSC_MaxMessagesPerSecond"]), float(conf.get("OSC_BudgetBurstTime", 0.1)))
+        self._build_templates()
         if run_server:
             self.start_server(avatar_change_function)
         
     def start_server(self, avatar_change_function) -> None:
         """
         Starts the OSC server and OSCQuery endpoints and advertises them.
+        With the asyncio engine the OSC server is not started here, the engine serves self.disp on its event loop.
         Parameters:
             avatar_change_function (function): Function to be called when the avatar changes
         Returns:
@@ -42,6 +86,7 @@ class OSC:
         """
         self.disp = dispatcher.Dispatcher()
         self.disp.map(AVATAR_CHANGE_PARAMETER, avatar_change_function)
+        self.avatar_change_function = avatar_change_function
         if self.server_port != 9001:
             logging.info("OSC Server port is not default, testing port availability and advertising OSCQuery endpoints")
             if self.server_port <= 0 or not check_if_udp_port_open(self.server_port):
@@ -52,16 +97,156 @@ class OSC:
             logging.info("OSC Server port is default.")
 
         logging.info("Waiting for VRChat to start.")
-        while not self.is_running():
-            time.sleep(3)
+        self.process_watcher.wait_for_start()
         logging.info("VRChat started!")
         self.qclient = self._wait_get_oscquery_client()
         self.curr_avatar = self.qclient.query_node(AVATAR_CHANGE_PARAMETER).value[0]
-        self.server = osc_server.ThreadingOSCUDPServer((self.ip, self.server_port), self.disp)
-        server_thread = Thread(target=self._osc_server_serve, daemon=True)
-        server_thread.start()
+        self.update_avatar_parameters()
+        if self.engine == "threaded":
+            self.server = osc_server.ThreadingOSCUDPServer((self.ip, self.server_port), self.disp)
+            server_thread = Thread(target=self._osc_server_serve, daemon=True)
+            server_thread.start()
         self.oscqs = OSCQueryService("ThumbParamsOSC", self.http_port, self.server_port)
         self.oscqs.advertise_endpoint(AVATAR_CHANGE_PARAMETER, access="readwrite")
+        self.process_watcher.subscribe(PROCESS_EXITED, self._on_vrchat_exited)
+        self.process_watcher.subscribe(PROCESS_STARTED, self._on_vrchat_started)
+        self.process_watcher.start()
+
+
+    def _get_output_parameters(self, action: dict) -> list:
+        """
+        Gets every OSC parameter an action can send, together with the type of its value.
+        Parameters:
+            action (dict): Action
+        Returns:
+            list: List of (parameter, type) tuples
+        """
+        def expand(parameter, binary):
+            if binary:
+                return [(parameter + "_Negative", bool)] + [(parameter + str(potency), int) for potency in self.binary_potencies]
+            return [(parameter, float)]
+
+        match action["type"]:
+            case "boolean":
+                return [(action["osc_parameter"], bool)]
+            case "vector1":
+                return expand(action["osc_parameter"], action["binary"])
+            case "vector2":
+                outputs = []
+                for i, parameter in enumerate(action["osc_parameter"]):
+                    outputs += [(parameter, bool)] if i == 2 else expand(parameter, action["binary"][i])
+                return outputs
+            case "skeleton":
+                outputs = []
+                for parameter in skeleton_parameters(action["osc_parameter"]):
+                    outputs += expand(parameter, action["binary"])
+                return outputs
+            case _:
+                raise TypeError("Unknown action type: " + action['type'])
+
+
+    def query_avatar_parameters(self) -> set | None:
+        """
+        Queries the parameters of the current avatar from the OSCQuery tree of VRChat. Blocks for the HTTP request.
+        Returns:
+            set | None: Names of the parameters, None if filtering is disabled or they could not be queried, then every parameter is sent
+        """
+        if not self.filter_avatar_parameters or self.qclient is None:
+            return None
+        parameters = None
+        try:
+            node = self.qclient.query_node(AVATAR_PARAMETERS_PREFIX[:-1], cache=False)
+            if node is not None:
+                # A parameter with a "/" in its name can also be a container of others, so typed nodes count rather than leaves
+                parameters = {subNode.full_path[len(AVATAR_PARAMETERS_PREFIX):] for subNode in node
+                              if (subNode.type_ is not None or subNode.value is not None)
+                              and subNode.full_path and subNode.full_path.startswith(AVATAR_PARAMETERS_PREFIX)}
+        except Exception as e:
+            logging.warning(f"Error querying the parameters of the current avatar: {e}")
+        # An empty tree is more likely an avatar that is still loading than one without parameters
+        if not parameters:
+            logging.warning("Could not get the parameters of the current avatar, sending all parameters.")
+            return None
+        logging.info(f"Current avatar has {len(parameters)} parameters.")
+        return parameters
+
+
+    def update_avatar_parameters(self) -> set | None:
+        """
+        Queries the parameters of the current avatar and only sends those until the next update.
+        Returns:
+            set | None: Names of the parameters, None if every parameter is sent
+        """
+        self.avatar_parameters = parameters = self.query_avatar_parameters()
+        return parameters
+
+
+    def is_on_avatar(self, action: Action) -> bool:
+        """
+        Checks if the current avatar has any of the parameters an action sends.
+        Parameters:
+            action (Action): Compiled action
+        Returns:
+            bool: True if the avatar has one of the parameters or its parameters are unknown
+        """
+        avatar_parameters = self.avatar_parameters
+        if avatar_parameters is None:
+            return True
+        outputs = self._get_output_parameters({"type": action.type, "osc_parameter": action.osc_parameter, "binary": action.binary})
+        return any(parameter in avatar_parameters for parameter, _ in outputs)
+
+
+    def _build_templates(self) -> None:
+        """
+        Pre-encodes a message template for every parameter the config can send.
+        Returns:
+            None
+        """
+        for parameter in ("ControllerType", "LeftThumb", "RightThumb"):
+            self._add_template(parameter, int)
+        for parameter in ("LeftABButtons", "RightABButtons"):
+            self._add_template(parameter, bool)
+        for action in self.config["actions"] + self.config["xinput_actions"]:
+            for parameter, type_ in self._get_output_parameters(action):
+                self._add_template(parameter, type_, self._get_priority(action, parameter))
+
+
+    def _get_priority(self, action: dict, parameter: str) -> int:
+        """
+        Gets the priority class of a parameter from the type of the action sending it, so the bits of a binary value are in the class of the value.
+        Parameters:
+            action (dict): Action
+            parameter (str): Name of the parameter
+        Returns:
+            int: Priority class
+        """
+        match action["type"]:
+            case "skeleton":
+                return PRIORITY_BULK
+            case "vector1":
+                return PRIORITY_ANALOG
+            case "vector2":
+                # The third parameter is the bool telling if the stick is moved
+                return PRIORITY_CRITICAL if len(action["osc_parameter"]) > 2 and parameter == action["osc_parameter"][2] else PRIORITY_ANALOG
+            case _:
+                return PRIORITY_CRITICAL
+
+
+    def _add_template(self, parameter: str, type_: type, priority: int | None = None) -> OSCMessageTemplate:
+        """
+        Adds the message template and bandwidth priority of a parameter.
+        Parameters:
+            parameter (str): Name of the parameter
+            type_ (type): Type of the value
+            priority (int | None): Priority class, derived from the type if None
+        Returns:
+            OSCMessageTemplate: Template of the parameter
+        """
+        template = self._templates[parameter] = OSCMessageTemplate(AVATAR_PARAMETERS_PREFIX + parameter, type_)
+        if priority is None:
+            priority = PRIORITY_ANALOG if type_ is float else PRIORITY_CRITICAL
+        self._priorities[parameter] = priority
+        return template
 
 
     def is_running(self) -> bool:
@@ -70,8 +255,39 @@ class OSC:
         Returns:
             bool: True if VRChat is running, False if not
         """
-        _proc_name = "VRChat.exe" if os.name == 'nt' else "VRChat"
-        return _proc_name in (p.name() for p in process_iter())
+        return self.process_watcher.poll()
+
+
+    def _on_vrchat_exited(self, pid: int) -> None:
+        """
+        Drops the cached OSCQuery responses of the VRChat instance that exited.
+        Parameters:
+            pid (int): PID of VRChat
+        Returns:
+            None
+        """
+        logging.warning("VRChat exited, waiting for it to start again.")
+        if self.qclient is not None:
+            self.qclient.invalidate()
+
+
+    def _on_vrchat_started(self, pid: int) -> None:
+        """
+        Discovers the OSCQuery service of a restarted VRChat on a thread of its own, so the process watcher keeps polling.
+        Parameters:
+            pid (int): PID of VRChat
+        Returns:
+            None
+        """
+        def reconnect():
+            self.qclient = self._wait_get_oscquery_client()
+            node = self.qclient.query_node(AVATAR_CHANGE_PARAMETER)
+            # Goes through the same path as an avatar change, which rebuilds the steps for the avatar parameters
+            self.curr_avatar = ""
+            if node is not None and node.value:
+                self.avatar_change_function(AVATAR_CHANGE_PARAMETER, node.value[0])
+
+        Thread(target=reconnect, daemon=True).start()
 
 
     def _wait_get_oscquery_client(self) -> OSCQueryClient:
@@ -80,12 +296,12 @@ class OSC:
         Returns:
             OSCQueryClient: OSCQueryClient for VRChat
         """
-        service_info = None
         logging.info("Waiting for VRChat to be discovered.")
-        while service_info is None:
-            browser = OSCQueryBrowser()
-            time.sleep(2) # Wait for discovery
-            service_info = browser.find_service_by_name("VRChat")
+        browser = OSCQueryBrowser()
+        try:
+            service_info = browser.wait_for_service("VRChat")
+        finally:
+            browser.close()
         logging.info("VRChat discovered!")
         client = OSCQueryClient(service_info)
         logging.info("Waiting for VRChat to be ready.")
@@ -118,7 +334,8 @@ class OSC:
         float_value = abs(float_value)
 
         # Calculate the total base-10 value based on the float value and number of bits
-        total_base_10 = int(float_value * self.binary_potency)
+        # Clamped, stick values can be slightly past 1 after deadzone scaling
+        total_base_10 = min(int(float_value * self.binary_potency), self.binary_potency)
         
         # Convert the total base-10 value to binary parameters
         binary_params = [int(bit) for bit in format(total_base_10, f'0{self.binary_num_bits}b')]
@@ -145,142 +362,276 @@ class OSC:
         return -float_value if negative else float_value
 
 
-    def _send_boolean_toggle(self, action: dict, value: bool) -> None:
+    def _send_boolean_toggle(self, action: Action, value: bool) -> None:
         """
-        Sends a boolean action as a toggle to VRChat via OSC.
+        Sends a boolean action as a toggle to VRChat via OSC. It flips when the button is pressed, holding it doesn't flip it again.
         Parameters:
-            action (dict): Action
+            action (Action): Action
             value (bool): Value of the parameter
         Returns:
             None
         """
-        if not action["enabled"]:
+        if action.timer is None:
+            action.timer = Timer()
+
+        pressed = value and not action.last_press
+        action.last_press = value
+        if pressed and not action.timer.pending:
+            action.last_value = not action.last_value
+            self.send_parameter(action.osc_parameter, action.last_value)
+            self.timers.schedule(action.timer, self.curr_time + TOGGLE_DEBOUNCE_TIME)
             return
         
-        if value:
-            action["last_value"] = not action["last_value"]
-            time.sleep(0.1)
-            self.send_parameter(action["osc_parameter"], action["last_value"])
-            return
-        
-        if action["always"]:
-            self.send_parameter(action["osc_parameter"], action["last_value"])
+        if action.always:
+            self.send_parameter(action.osc_parameter, action.last_value)
 
 
-    def _send_boolean(self, action: dict, value: bool) -> None:
+    def _send_boolean(self, action: Action, value: bool) -> None:
         """
         Sends a boolean action to VRChat via OSC.
         Parameters:
-            action (dict): Action
+            action (Action): Action
             value (bool): Value of the parameter
         Returns:
             None
         """
-        _do_send = action["always"] == 2 or (action["always"] == 0 and action["last_value"] != value) or (action["always"] == 1 and value)
-
-        if not action["enabled"] or not _do_send:
+        always = action.always
+        if not (always == 2 or (always == 0 and action.last_value != value) or (always == 1 and value)):
             return
 
-        if action["floating"]:
+        if action.floating:
             if value:
-                action["timestamp"] = self.curr_time
-            elif not value and self.curr_time - action["timestamp"] <= action["floating"]: 
-                value = action["last_value"]
+                action.timestamp = self.curr_time
+            elif self.curr_time - action.timestamp <= action.floating:
+                value = action.last_value
+                self._schedule_release(action, action.timestamp + action.floating)
 
-        if _do_send:
-            self.send_parameter(action["osc_parameter"], value)
-            action["last_value"] = value
+        self.send_parameter(action.osc_parameter, value)
+        action.last_value = value
 
 
-    def _send_vector1(self, action: dict, value: float) -> None:
+    def _send_float(self, parameter: str, value: float, binary: bool) -> None:
         """
-        Sends a vector1 action to VRChat via OSC.
+        Sends a float parameter, split into binary parameters if needed.
         Parameters:
-            action (dict): Action
+            parameter (str): Name of the parameter
             value (float): Value of the parameter
+            binary (bool): Whether to send the value as binary parameters
         Returns:
             None
         """
-        _do_send = action["always"] == 2 or (action["always"] == 0 and action["last_value"] != value) or (action["always"] == 1 and value)
+        if not binary:
+            self.send_parameter(parameter, value)
+            return
 
-        if not action["enabled"] or not _do_send:
+        tmp = self._float_to_binary(value)
+        negative = parameter + "_Negative"
+        if self.budget is not None:
+            # The bits of a value are budgeted as one unit, so VRChat never puts a value together from bits of different ones
+            messages = [(negative, tmp[-1])] + [(parameter + str(potency), bit) for potency, bit in zip(self.binary_potencies, reversed(tmp[:-1]))]
+            avatar_parameters = self.avatar_parameters
+            if avatar_parameters is not None:
+                present = [message for message in messages if message[0] in avatar_parameters]
+                self.absent_messages += len(messages) - len(present)
+                if not present:
+                    return
+                messages = present
+            if negative not in self._priorities:
+                self._add_template(negative, bool, PRIORITY_ANALOG)
+            self.budget.offer(parameter, value, self._priorities[negative], messages)
+            return
+
+        self.send_parameter(negative, tmp[-1])
+        tmp = tmp[:-1]
+        tmp.reverse()
+        for i in range(len(tmp)):
+            self.send_parameter(parameter + str(self.binary_potencies[i]), tmp[i])
+
+
+    def _send_vector1(self, action: Action, value: float) -> None:
+        """
+        Sends a vector1 action to VRChat via OSC.
+        Parameters:
+            action (Action): Action
+            value (float): Value of the parameter
+        Returns:
+            None
+        """
+        raw_value = value
+        if action.filter is not None:
+            value = action.filter.apply(value, action.last_value)
+
+        always = action.always
+        if not (always == 2 or (always == 0 and action.last_value != value) or (always == 1 and value)):
+            if value != raw_value:
+                self._count_filtered(action.osc_parameter, action.binary)
             return
         
-        if action["floating"]:
-            if value > action["last_value"]:
-                action["timestamp"] = self.curr_time
-            elif value < action["last_value"] and self.curr_time - action["timestamp"] <= action["floating"]: 
-                value = action["last_value"]
-
-        if _do_send:
-            if action["binary"]:
-                tmp = self._float_to_binary(value)
-                self.send_parameter(action["osc_parameter"] + "_Negative", tmp[-1])
-                tmp = tmp[:-1]
-                tmp.reverse()
-                for i in range(len(tmp)):
-                    self.send_parameter(action["osc_parameter"] + str(self.binary_potencies), tmp[i])
-            else:
-                self.send_parameter(action["osc_parameter"], value)
-            action["last_value"] = value
-
-
-    def _send_vector2(self, action: dict, value: tuple) -> None:
+        if action.floating:
+            if value > action.last_value:
+                action.timestamp = self.curr_time
+            elif value < action.last_value and self.curr_time - action.timestamp <= action.floating:
+                value = action.last_value
+                self._schedule_release(action, action.timestamp + action.floating)
+
+        self._send_float(action.osc_parameter, value, action.binary)
+        action.last_value = value
+
+
+    def _send_vector2(self, action: Action, value: tuple) -> None:
         """
         Sends a vector2 action to VRChat via OSC.
         Parameters:
-            action (dict): Action
+            action (Action): Action
             value (tuple): X and Y value of the parameter in a tuple
         Returns:
             None
         """
         val_x, val_y = value[0], value[1]
-        if action["unsigned"][0]:
+        if action.unsigned[0]:
             val_x = (val_x + 1) / 2
-        if action["unsigned"][1]:
+        if action.unsigned[1]:
             val_y = (val_y + 1) / 2
 
-        if action["floating"]:
+        if action.floating:
             if val_x:
-                action["timestamp"][0] = self.curr_time
-            elif not val_x and self.curr_time - action["timestamp"][0] <= action["floating"][0]: 
-                val_x = action["last_value"][0]
+                action.timestamp[0] = self.curr_time
+            elif self.curr_time - action.timestamp[0] <= action.floating[0]:
+                val_x = action.last_value[0]
+                self._schedule_release(action, action.timestamp[0] + action.floating[0])
             if val_y:
-                action["timestamp"][1] = self.curr_time
-            elif not val_y and self.curr_time - action["timestamp"][1] <= action["floating"][1]:
-                val_y = action["last_value"][1]
+                action.timestamp[1] = self.curr_time
+            elif self.curr_time - action.timestamp[1] <= action.floating[1]:
+                val_y = action.last_value[1]
+                self._schedule_release(action, action.timestamp[1] + action.floating[1])
+
+        raw_value = (val_x, val_y)
+        if action.filter is not None:
+            if action.filter[0] is not None:
+                val_x = action.filter[0].apply(val_x, action.last_value[0])
+            if action.filter[1] is not None:
+                val_y = action.filter[1].apply(val_y, action.last_value[1])
 
         val_bool = (val_x > self.stick_tolerance or val_y > self.stick_tolerance) or (val_x < -self.stick_tolerance or val_y < -self.stick_tolerance)
-        value = [val_x, val_y, val_bool]
+        value = (val_x, val_y, val_bool)
 
-        for i in range(len(action["osc_parameter"])):
-            if not action["enabled"][i]:
+        for i in range(len(action.osc_parameter)):
+            if not action.enabled[i]:
                 continue
-            if action["always"][i] == 2 or (action["always"][i] == 0 and action["last_value"][i] != value[i]) or (action["always"][i] == 1 and value[i]):
-                if action["binary"][i]:
-                    value[i] = self._float_to_binary(value[i])
-                    tmp = value[i]
-                    self.send_parameter(action["osc_parameter"][i] + "_Negative", tmp[-1])
-                    tmp = tmp[:-1]
-                    tmp.reverse()
-                    for j in range(len(tmp)):
-                        self.send_parameter(action["osc_parameter"][i] + str(self.binary_potencies), tmp[j])
+            always = action.always[i]
+            if always == 2 or (always == 0 and action.last_value[i] != value[i]) or (always == 1 and value[i]):
+                if i == 2:
+                    self.send_parameter(action.osc_parameter[i], value[i])
                 else:
-                    self.send_parameter(action["osc_parameter"][i], value[i])
-                action["last_value"][i] = value[i]
+                    self._send_float(action.osc_parameter[i], value[i], action.binary[i])
+                action.last_value[i] = value[i]
+            elif i < 2 and value[i] != raw_value[i]:
+                self._count_filtered(action.osc_parameter[i], action.binary[i])
 
 
-    def _send_skeleton(self, action: dict, skeleton) -> None:
-        if skeleton is None or not action["enabled"]:
+    def _send_skeleton(self, action: SkeletonAction, skeleton) -> None:
+        """
+        Sends the finger curl and splay values of a skeleton action that changed to VRChat via OSC.
+        Parameters:
+            action (SkeletonAction): Action
+            skeleton (openvr.VRSkeletalSummaryData_t): Skeletal summary data, None if there is none
+        Returns:
+            None
+        """
+        if skeleton is None:
             return
 
-        base_osc_parameter = action['osc_parameter']
-        parameters = [(FINGERS, "Curl", skeleton.flFingerCurl), (SPLAYFINGERS, "Splay", skeleton.flFingerSplay)]
+        ctypes.memmove(action.address, ctypes.addressof(skeleton), SKELETON_SIZE)
+        values, last_values, timestamps = action.buffer, action.last_value, action.timestamp
+        always, floating, filter = action.always, action.floating, action.filter
+
+        if always == 0:
+            # One comparison of the whole buffer, then only the slots that moved are looked at
+            if values == last_values:
+                return
+            indices = [i for i, (value, last_value) in enumerate(zip(values, last_values)) if value != last_value]
+        else:
+            indices = range(len(values))
+
+        for i in indices:
+            value, last_value = values[i], last_values[i]
+            filtered = False
+            if filter is not None:
+                value = filter.apply(value, last_value)
+                filtered = value != values[i]
+
+            if floating:
+                if value > last_value:
+                    timestamps[i] = self.curr_time
+                elif value < last_value and self.curr_time - timestamps[i] <= floating:
+                    value = last_value
+                    self._schedule_release(action, timestamps[i] + floating)
+
+            # Same as vector1: always 0 sends changes, always 1 sends positive values, always 2 sends everything
+            if not (always == 2 or (always == 0 and value != last_value) or (always == 1 and value)):
+                if filtered:
+                    self._count_filtered(action.parameters[i], action.binary)
+                continue
+
+            self._send_float(action.parameters[i], value, action.binary)
+            last_values[i] = value
+
+
+    def _count_filtered(self, parameter: str, binary: bool = False) -> None:
+        """
+        Counts the messages of a value that was not sent because of deadband or quantization.
+        Parameters:
+            parameter (str): Name of the parameter
+            binary (bool): Whether the value is sent as binary parameters, its sign and every bit then count as a message
+        Returns:
+            None
+        """
+        if binary:
+            parameters = [parameter + "_Negative"] + [parameter + str(potency) for potency in self.binary_potencies]
+        else:
+            parameters = [parameter]
+        for parameter in parameters:
+            template = self._templates.get(parameter)
+            self.filtered_messages += 1
+            self.filtered_bytes += len(template.buffer) + 4 if template is not None else 0
+
+
+    def _schedule_release(self, action: Action, deadline: float) -> None:
+        """
+        Schedules the action to be sent again when a floating value it holds expires,
+        so it is released on time even if nothing else triggers a send.
+        Parameters:
+            action (Action): Action holding a floating value
+            deadline (float): Time at which the floating value expires
+        Returns:
+            None
+        """
+        if action.timer is None:
+            action.timer = Timer(lambda: action.sender(action, action.value))
+        if not action.timer.pending or deadline < action.timer.deadline:
+            self.timers.schedule(action.timer, deadline)
+
 
-        for param_group, param_type, finger_data in parameters:
-            for fname, fidx in param_group.items():
-                osc_parameter = f"{base_osc_parameter}/{param_type}/{fname}"
-                self._send_vector1({**action, "osc_parameter": osc_parameter}, finger_data[fidx])
+    def get_sender(self, action_type: str, floating: float | list = 0.0):
+        """
+        Gets the function that sends actions of the given type.
+        Parameters:
+            action_type (str): Type of the action
+            floating (float | list): Floating value of the action, -1 turns booleans into toggles
+        Returns:
+            function: Sender taking the action and its value
+        """
+        match action_type:
+            case "boolean":
+                return self._send_boolean_toggle if floating == -1 else self._send_boolean
+            case "vector1":
+                return self._send_vector1
+            case "vector2":
+                return self._send_vector2
+            case "skeleton":
+                return self._send_skeleton
+            case _:
+                raise TypeError("Unknown action type: " + action_type)
 
 
     def refresh_time(self) -> None:
@@ -292,48 +643,152 @@ class OSC:
         self.curr_time = time.time()
 
 
+    def run_timers(self) -> None:
+        """
+        Runs all deferred sends that are due. Called once per tick after refresh_time().
+        Returns:
+            None
+        """
+        self.timers.advance(self.curr_time)
+
+
+    def _send_datagram(self, data) -> None:
+        """
+        Sends a datagram to VRChat over the blocking UDP socket.
+        Replaced by the transport of the asyncio engine while it is running.
+        Parameters:
+            data (bytes-like): Datagram
+        Returns:
+            None
+        """
+        self._sock.sendto(data, self.osc_address)
+
+
     def send_parameter(self, parameter: str, value) -> None:
         """
         Sends a parameter to VRChat via OSC.
+        If bundling or the bandwidth budget is enabled the message is queued and sent with the next flush().
         Parameters:
             parameter (str): Name of the parameter
             value (any): Value of the parameter
-            floating (str): Floating value of the parameter, just for for debug output
         Returns:
             None
         """
-        self.osc_client.send_message(AVATAR_PARAMETERS_PREFIX + parameter, value)
+        avatar_parameters = self.avatar_parameters
+        if avatar_parameters is not None and parameter not in avatar_parameters:
+            self.absent_messages += 1
+            return
+        if self.budget is not None:
+            if parameter not in self._priorities:
+                self._add_template(parameter, type(value))
+            self.budget.offer(parameter, value, self._priorities[parameter])
+            return
+        self._emit(parameter, value)
 
 
-    def send(self, action: dict | str, value: bool | float | tuple) -> None:
+    def _emit(self, parameter: str, value) -> None:
         """
-        Sends an OSC message to VRChat.
+        Encodes a parameter and sends it or adds it to the pending bundle.
         Parameters:
-            action (dict | str): Action or OSC address
-            value (bool | float | tuple): Value of the parameter
+            parameter (str): Name of the parameter
+            value (any): Value of the parameter
         Returns:
             None
         """
-        if isinstance(action, str):
-            self.config[action]["osc_parameter"] = action
-            self.config[action]["floating"] = 0.0
-            self._send_boolean(self.config[action], value)
+        template = self._templates.get(parameter)
+        if template is None:
+            template = self._add_template(parameter, type(value))
+
+        if self.recorder is not None:
+            self.recorder.record_message(parameter, value)
+
+        with self._bundle_lock:
+            self.sent_messages += 1
+            self.sent_bytes += len(template.buffer) + 4
+            template.sent += 1
+            if not self.bundling:
+                self.sent_datagrams += 1
+                self.send_datagram(template.encode(value))
+                return
+            self._add_to_bundle(template.encode(value))
+
+
+    def _add_to_bundle(self, dgram: bytearray) -> None:
+        """
+        Appends an encoded OSC message to the pending bundle, flushing first if it would exceed the MTU.
+        Must be called with the bundle lock held.
+        Parameters:
+            dgram (bytearray): Encoded OSC message
+        Returns:
+            None
+        """
+        size = len(dgram)
+        if self._bundle_len + 4 + size > self.mtu:
+            self._flush_bundle()
+            if len(OSC_BUNDLE_HEADER) + 4 + size > self.mtu:
+                # Can never fit into a bundle, send it on its own
+                self.sent_datagrams += 1
+                self.send_datagram(dgram)
+                return
+        struct.pack_into(">i", self._bundle, self._bundle_len, size)
+        self._bundle_len += 4
+        self._bundle[self._bundle_len:self._bundle_len + size] = dgram
+        self._bundle_len += size
+        self._bundle_count += 1
+
+
+    def _flush_bundle(self) -> None:
+        """
+        Sends the pending bundle. Must be called with the bundle lock held.
+        Returns:
+            None
+        """
+        if self._bundle_count == 0:
             return
-        
-        match action['type']:
-            case "boolean":
-                if action["floating"] == -1:
-                    self._send_boolean_toggle(action, value)
-                else:
-                    self._send_boolean(action, value)
-            case "vector1":
-                self._send_vector1(action, value)
-            case "vector2":
-                self._send_vector2(action, value)
-            case "skeleton":
-                self._send_skeleton(action, value)
-            case _:
-                raise TypeError("Unknown action type: " + action['type'])
+
+        self.sent_datagrams += 1
+        if self._bundle_count == 1:
+            # A bundle of one is just overhead, send the bare message
+            self.send_datagram(memoryview(self._bundle)[len(OSC_BUNDLE_HEADER) + 4:self._bundle_len])
+        else:
+            self.send_datagram(memoryview(self._bundle)[:self._bundle_len])
+        self._bundle_len = len(OSC_BUNDLE_HEADER)
+        self._bundle_count = 0
+
+
+    def flush(self) -> None:
+        """
+        Sends all messages queued since the last flush as one or more OSC bundles.
+        With a bandwidth budget only the messages that fit into the budget are sent, the rest stays queued.
+        Returns:
+            None
+        """
+        if self.budget is not None:
+            for parameter, value in self.budget.drain():
+                self._emit(parameter, value)
+        with self._bundle_lock:
+            self._flush_bundle()
+
+
+    def get_parameter_counts(self) -> dict:
+        """
+        Gets the number of messages sent per parameter.
+        Returns:
+            dict: Sent messages by parameter, parameters that were never sent are left out
+        """
+        return {parameter: template.sent for parameter, template in list(self._templates.items()) if template.sent}
+
+
+    def get_filter_savings(self) -> str:
+        """
+        Gets a summary of the traffic saved by deadband and quantization.
+        Returns:
+            str: Summary
+        """
+        total = self.sent_messages + self.filtered_messages
+        percentage = self.filtered_messages / total * 100 if total else 0.0
+        return f"Deadband/Quantization saved {self.filtered_messages} of {total} messages ({percentage:.1f}%, {self.filtered_bytes / 1024:.1f} KiB)"
+
 
     def shutdown(self) -> None:
         """
@@ -341,7 +796,10 @@ class OSC:
         Returns:
             None
         """
+        self.flush()
         if self.server:
             self.server.shutdown()
+        self.process_watcher.stop()
         if self.oscqs:
             self.oscqs.stop()
+        close_zeroconf()
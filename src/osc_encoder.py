@@ -0,0 +1,64 @@
+import struct
+
+OSC_TYPE_TAGS = {
+    bool: b",T\x00\x00",
+    int: b",i\x00\x00",
+    float: b",f\x00\x00",
+}
+OSC_TRUE = ord("T")
+OSC_FALSE = ord("F")
+
+_INT = struct.Struct(">i")
+_FLOAT = struct.Struct(">f")
+
+
+def pad_osc_string(value: str) -> bytes:
+    """
+    Encodes a string as a null terminated OSC-string padded to a multiple of 4 bytes.
+    Parameters:
+        value (str): String to encode
+    Returns:
+        bytes: Encoded string
+    """
+    encoded = value.encode("utf-8")
+    return encoded + b"\x00" * (4 - len(encoded) % 4)
+
+
+class OSCMessageTemplate:
+    """
+    A pre-encoded OSC message with a single argument.
+    Address and type tag are encoded once, sending only patches the value bytes in place.
+    """
+    __slots__ = ("address", "type_", "buffer", "value_offset", "sent")
+
+    def __init__(self, address: str, type_: type) -> None:
+        if type_ not in OSC_TYPE_TAGS:
+            raise TypeError(f"Unsupported OSC argument type: {type_}")
+        self.address = address
+        self.type_ = type_
+        self.sent = 0
+        head = pad_osc_string(address)
+        if type_ is bool:
+            # Booleans are carried by the type tag itself and have no argument bytes
+            self.value_offset = len(head) + 1
+            self.buffer = bytearray(head + OSC_TYPE_TAGS[bool])
+        else:
+            self.value_offset = len(head) + 4
+            self.buffer = bytearray(head + OSC_TYPE_TAGS[type_] + b"\x00" * 4)
+
+    def encode(self, value) -> bytearray:
+        """
+        Writes the value into the template.
+        The returned buffer is reused by the next call, send it before encoding again.
+        Parameters:
+            value (bool | int | float): Value of the argument
+        Returns:
+            bytearray: Encoded OSC message
+        """
+        if self.type_ is float:
+            _FLOAT.pack_into(self.buffer, self.value_offset, value)
+        elif self.type_ is bool:
+            self.buffer[self.value_offset] = OSC_TRUE if value else OSC_FALSE
+        else:
+            _INT.pack_into(self.buffer, self.value_offset, int(value))
+        return self.buffer
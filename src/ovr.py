@@ -1,7 +1,10 @@
 import openvr
 import openvr.error_code
+import ctypes
 import os
 import logging
+from functools import partial
+from tracked_devices import TrackedDeviceRegistry, DEVICE_EVENTS
 
 FINGERS = {
     "Thumb": openvr.VRFinger_Thumb,
@@ -18,6 +21,65 @@ SPLAYFINGERS = {
     "Pinky": openvr.VRFingerSplay_Ring_Pinky
 }
 
+check_input_error = openvr.error_code.InputError.check_error_value
+
+
+class EventDispatcher:
+    """
+    Calls the subscribers of a SteamVR event type for every event of that type.
+    Subscribers get the VREvent_t, which is reused for the next event, so it must not be kept after the call.
+    """
+
+    def __init__(self) -> None:
+        self.subscribers = {}
+
+
+    def subscribe(self, event_type: int, callback) -> None:
+        """
+        Subscribes to an event type.
+        Parameters:
+            event_type (int): Event type (openvr.VREvent_*)
+            callback (function): Function that takes the event
+        Returns:
+            None
+        """
+        self.subscribers.setdefault(event_type, []).append(callback)
+
+
+    def unsubscribe(self, event_type: int, callback) -> None:
+        """
+        Unsubscribes from an event type.
+        Parameters:
+            event_type (int): Event type (openvr.VREvent_*)
+            callback (function): Function that was subscribed
+        Returns:
+            None
+        """
+        subscribers = self.subscribers.get(event_type)
+        if subscribers is not None and callback in subscribers:
+            subscribers.remove(callback)
+            if not subscribers:
+                del self.subscribers[event_type]
+
+
+    def dispatch(self, event: openvr.VREvent_t) -> None:
+        """
+        Calls the subscribers of the type of an event. Events without subscribers are dropped.
+        Parameters:
+            event (openvr.VREvent_t): Event
+        Returns:
+            None
+        """
+        subscribers = self.subscribers.get(event.eventType)
+        if subscribers is None:
+            return
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception:
+                logging.exception(f"Error handling SteamVR event {event.eventType}")
+
+
 class OVR:
     def __init__(self, config:dict, config_path: str, manifest_path: str, first_launch_file: str):
         self.application = openvr.init(openvr.VRApplication_Utility)
@@ -36,61 +98,210 @@ class OVR:
         for action in config["actions"]:
             action["handle"] = openvr.VRInput().getActionHandle(action['name'])
 
+        # Everything read every tick goes through the raw function tables with preallocated structs
+        self.input_functions = openvr.VRInput().function_table
+        self.action_data = {}
+        self.event = openvr.VREvent_t()
+        self._poll_next_event = partial(self.application.function_table.pollNextEvent, ctypes.byref(self.event), ctypes.sizeof(self.event))
+        self._update_action_state = partial(self.input_functions.updateActionState, ctypes.byref(self.actionset), ctypes.sizeof(self.actionset), len(self.actionsets))
+
+        self.events = EventDispatcher()
+        self.devices = TrackedDeviceRegistry(openvr.VRSystem())
+        self.devices.refresh()
+        for event_type in DEVICE_EVENTS:
+            self.events.subscribe(event_type, self.devices.handle_event)
+        self.events.subscribe(openvr.VREvent_Input_ActionManifestReloaded, lambda event: logging.info("Action manifest reloaded."))
+        self.events.subscribe(openvr.VREvent_Input_ActionManifestLoadFailed, lambda event: logging.error("SteamVR failed to load the action manifest."))
+
 
     def get_controllertype(self) -> int:
         """
-        Gets the type of controller from SteamVR.
+        Gets the type of controller from the tracked device registry.
         Returns:
             int: Type of controller (0 = Unknown, 1 = Knuckles, 2 = Oculus/Meta Touch)
         """
-        for i in range(1, openvr.k_unMaxTrackedDeviceCount):
-            device_class = openvr.VRSystem().getTrackedDeviceClass(i)
-            if device_class == 2:
-                match openvr.VRSystem().getStringTrackedDeviceProperty(i, openvr.Prop_ControllerType_String):
-                    case 'knuckles':
-                        return 1
-                    case 'oculus_touch':
-                        return 2
-                    case _:
-                        return 0
-        return 0
+        return self.devices.controller_type
 
 
-    def get_value(self, action: dict) -> bool | float | tuple | openvr.VRSkeletalSummaryData_t | None:
+    def _get_action_data(self, handle: int, struct_type):
         """
-        Gets the value of an action by querying SteamVR.
+        Gets the preallocated result struct of an action, so reading it every tick does not allocate a new one.
+        Parameters:
+            handle (int): Action handle
+            struct_type (type): ctypes struct the action is read into
+        Returns:
+            tuple: Struct and a reusable reference to it
+        """
+        if handle not in self.action_data:
+            data = struct_type()
+            self.action_data[handle] = (data, ctypes.byref(data))
+        return self.action_data[handle]
+
+
+    def _digital_reader(self, handle: int):
+        """
+        Gets a function without arguments that reads a digital action into its preallocated struct.
+        Parameters:
+            handle (int): Action handle
+        Returns:
+            function: Reader returning the InputDigitalActionData_t of the action
+        """
+        fn = self.input_functions.getDigitalActionData
+        data, ref = self._get_action_data(handle, openvr.InputDigitalActionData_t)
+        size = ctypes.sizeof(data)
+        def read() -> openvr.InputDigitalActionData_t:
+            error = fn(handle, ref, size, openvr.k_ulInvalidInputValueHandle)
+            if error:
+                check_input_error(error)
+            return data
+        return read
+
+
+    def _analog_reader(self, handle: int):
+        """
+        Gets a function without arguments that reads an analog action into its preallocated struct.
+        Parameters:
+            handle (int): Action handle
+        Returns:
+            function: Reader returning the InputAnalogActionData_t of the action
+        """
+        fn = self.input_functions.getAnalogActionData
+        data, ref = self._get_action_data(handle, openvr.InputAnalogActionData_t)
+        size = ctypes.sizeof(data)
+        def read() -> openvr.InputAnalogActionData_t:
+            error = fn(handle, ref, size, openvr.k_ulInvalidInputValueHandle)
+            if error:
+                check_input_error(error)
+            return data
+        return read
+
+
+    def _skeleton_reader(self, handle: int):
+        """
+        Gets a function without arguments that reads the skeletal summary of a skeleton action into its preallocated struct.
+        The struct is overwritten by the next read, so it must be consumed within the tick.
+        Parameters:
+            handle (int): Action handle
+        Returns:
+            function: Reader returning the VRSkeletalSummaryData_t of the action, None if there is no data
+        """
+        fn = self.input_functions.getSkeletalSummaryData
+        data, ref = self._get_action_data(handle, openvr.VRSkeletalSummaryData_t)
+        def read() -> openvr.VRSkeletalSummaryData_t | None:
+            error = fn(handle, openvr.VRSummaryType_FromDevice, ref)
+            if error:
+                if error == openvr.VRInputError_NoData:
+                    return None
+                check_input_error(error)
+            return data
+        return read
+
+
+    def get_reader(self, action: dict):
+        """
+        Gets a function without arguments that reads the value of an action.
         Parameters:
             action (dict): Action
         Returns:
-            any: Value of the action
+            function: Reader of the action
         """
         match action['type']:
             case "boolean":
-                return bool(openvr.VRInput().getDigitalActionData(action['handle'], openvr.k_ulInvalidInputValueHandle).bState)
+                read = self._digital_reader(action['handle'])
+                return lambda: bool(read().bState)
             case "vector1":
-                return float(openvr.VRInput().getAnalogActionData(action['handle'], openvr.k_ulInvalidInputValueHandle).x)
+                read = self._analog_reader(action['handle'])
+                return lambda: read().x
             case "vector2":
-                tmp = openvr.VRInput().getAnalogActionData(action['handle'], openvr.k_ulInvalidInputValueHandle)
-                return tmp.x, tmp.y
+                def read_vector2(read=self._analog_reader(action['handle'])) -> tuple:
+                    data = read()
+                    return data.x, data.y
+                return read_vector2
             case "skeleton":
-                try:
-                    tmp = openvr.VRInput().getSkeletalSummaryData(action['handle'], openvr.VRSummaryType_FromDevice)
-                    return tmp
-                except openvr.error_code.InputError_NoData:
-                    return None
+                return self._skeleton_reader(action['handle'])
+            case _:
+                raise TypeError("Unknown action type: " + action['type'])
+
+
+    def get_change_reader(self, action: dict):
+        """
+        Gets a function without arguments that reads the value of an action together with a change indicator.
+        Digital actions use bChanged, analog actions have no such flag and count as changed when deltaX or deltaY is not 0.
+        Skeleton actions have no change indicator in SteamVR.
+        Parameters:
+            action (dict): Action
+        Returns:
+            function: Reader of the action returning (value, changed), None for skeleton actions
+        """
+        match action['type']:
+            case "boolean":
+                def read_boolean(read=self._digital_reader(action['handle'])) -> tuple[bool, bool]:
+                    data = read()
+                    return bool(data.bState), bool(data.bChanged)
+                return read_boolean
+            case "vector1":
+                def read_vector1(read=self._analog_reader(action['handle'])) -> tuple[float, bool]:
+                    data = read()
+                    return data.x, data.deltaX != 0
+                return read_vector1
+            case "vector2":
+                def read_vector2(read=self._analog_reader(action['handle'])) -> tuple[tuple, bool]:
+                    data = read()
+                    return (data.x, data.y), data.deltaX != 0 or data.deltaY != 0
+                return read_vector2
+            case "skeleton":
+                return None
             case _:
                 raise TypeError("Unknown action type: " + action['type'])
 
 
+    def get_value(self, action: dict) -> bool | float | tuple | openvr.VRSkeletalSummaryData_t | None:
+        """
+        Gets the value of an action by querying SteamVR.
+        Parameters:
+            action (dict): Action
+        Returns:
+            any: Value of the action
+        """
+        return self.get_reader(action)()
+
+
     def poll_next_events(self):
-        _event = openvr.VREvent_t()
-        _has_events = True
-        while _has_events:
-            _has_events = self.application.pollNextEvent(_event)
-        try:
-            openvr.VRInput().updateActionState(self.actionsets)
-        except openvr.error_code.InputError_NoData:
+        self.drain_events()
+        self.update_action_state()
+
+
+    def drain_events(self) -> None:
+        """
+        Dispatches the pending SteamVR events.
+        Returns:
+            None
+        """
+        dispatch = self.events.dispatch
+        while self._poll_next_event():
+            dispatch(self.event)
+
+
+    def update_action_state(self) -> None:
+        """
+        Reads the current state of all actions from SteamVR.
+        Returns:
+            None
+        """
+        error = self._update_action_state()
+        if error == openvr.VRInputError_NoData:
             logging.error("No data available for action state update.")
+        elif error:
+            check_input_error(error)
+
+
+    def acknowledge_quit(self) -> None:
+        """
+        Tells SteamVR that the application is exiting after it asked it to quit.
+        Returns:
+            None
+        """
+        openvr.VRSystem().acknowledgeQuit_Exiting()
 
 
     def shutdown(self) -> bool:
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+
+import psutil
+
+PROCESS_STARTED = "start"
+PROCESS_EXITED = "exit"
+# Processes younger than this are looked at again on the next poll, a forked process only gets its name once it calls exec
+YOUNG_PROCESS_AGE = 10.0
+
+
+class ProcessWatcher:
+    """
+    Watches for a process by name and calls subscribers when it starts and exits.
+    Until the process is found, every poll lists the PIDs (a listdir of /proc on Linux) and only looks up the names of PIDs that are new since the last poll.
+    Once found, only that PID is re-validated, psutil compares its creation time so a reused PID is not mistaken for the process.
+    """
+
+    def __init__(self, name: str, interval: float = 3.0) -> None:
+        self.name = name
+        self.interval = interval
+        self.process = None
+        self.subscribers = {}
+        self.started = threading.Event()
+        self._known_pids = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    @property
+    def pid(self) -> int | None:
+        process = self.process
+        return process.pid if process is not None else None
+
+
+    def subscribe(self, event: str, callback) -> None:
+        """
+        Subscribes to the start or exit of the process.
+        Parameters:
+            event (str): PROCESS_STARTED or PROCESS_EXITED
+            callback (function): Function that takes the PID
+        Returns:
+            None
+        """
+        self.subscribers.setdefault(event, []).append(callback)
+
+
+    def _dispatch(self, event: str, pid: int) -> None:
+        for callback in self.subscribers.get(event, ()):
+            try:
+                callback(pid)
+            except Exception:
+                logging.exception(f"Process {event} subscriber failed")
+
+
+    def _find(self) -> psutil.Process | None:
+        pids = set(psutil.pids())
+        new_pids = pids - self._known_pids
+        young_before = time.time() - YOUNG_PROCESS_AGE
+        for pid in new_pids:
+            try:
+                process = psutil.Process(pid)
+                if process.create_time() > young_before:
+                    pids.discard(pid)
+                if process.name() == self.name and process.status() != psutil.STATUS_ZOMBIE:
+                    self._known_pids = pids
+                    return process
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        self._known_pids = pids
+        return None
+
+
+    def poll(self) -> bool:
+        """
+        Checks the process once, calling the subscribers if it started or exited since the last poll.
+        Returns:
+            bool: True if the process is running
+        """
+        with self._lock:
+            process = self.process
+            if process is not None:
+                if process.is_running() and process.status() != psutil.STATUS_ZOMBIE:
+                    return True
+                self.process = None
+                self.started.clear()
+                # Everything is checked again on the next poll, the process could restart with any PID
+                self._known_pids = set()
+                logging.info(f"{self.name} exited (PID {process.pid})")
+                self._dispatch(PROCESS_EXITED, process.pid)
+                return False
+
+            process = self._find()
+            if process is None:
+                return False
+            self.process = process
+            self.started.set()
+            logging.info(f"{self.name} started (PID {process.pid})")
+            self._dispatch(PROCESS_STARTED, process.pid)
+            return True
+
+
+    def wait_for_start(self, timeout: float | None = None) -> bool:
+        """
+        Waits until the process is running, polling every interval unless the watcher thread is running already.
+        Parameters:
+            timeout (float | None): Seconds to wait at most, None to wait forever
+        Returns:
+            bool: True if the process is running
+        """
+        if self._thread is not None:
+            return self.started.wait(timeout)
+        remaining = timeout
+        while not self.poll():
+            if remaining is not None:
+                if remaining <= 0:
+                    return False
+                remaining -= self.interval
+            if self._stop.wait(self.interval):
+                return False
+        return True
+
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                logging.exception("Process watcher poll failed")
+            self._stop.wait(self.interval)
+
+
+    def start(self) -> None:
+        """
+        Polls on a daemon thread every interval, so the subscribers are called without anyone polling.
+        Returns:
+            None
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+
+    def stop(self) -> None:
+        """
+        Stops the watcher thread.
+        Returns:
+            None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
@@ -0,0 +1,269 @@
+"""
+Replay backends with the same interface as OVR and XboxController, so the pipeline can run without SteamVR and XInput.
+
+A trace is a list of frames, stored as one JSON object per line:
+    {"t": 0.016, "ovr": {"/actions/thumbparams/in/leftabutton": true}, "xinput": {"LeftTrigger": 0.5}, "controller_type": 1}
+t is the time of the frame in seconds from the start of the trace. Every other key is optional and only holds what changed.
+ovr values are keyed by action name: booleans, floats, [x, y] for vector2 and 9 floats (5 curl, 4 splay) for skeleton actions.
+xinput values are keyed by the names in xbox_controller.DEFAULT_ACTIONS.
+"""
+import ctypes
+import json
+import logging
+import math
+import random
+import time
+from functools import partial
+
+import openvr
+
+from actions import SKELETON_VALUES
+from ovr import EventDispatcher
+from xbox_controller import XboxController, DEFAULT_ACTIONS
+
+SYNTHETIC = "synthetic"
+DEFAULT_VALUES = {
+    "boolean": False,
+    "vector1": 0.0,
+    "vector2": (0.0, 0.0)
+}
+
+
+def load_trace(path: str) -> list:
+    """
+    Loads a trace from a JSON lines file.
+    Parameters:
+        path (str): Path of the trace
+    Returns:
+        list: Frames ordered by time
+    """
+    with open(path) as f:
+        frames = [json.loads(line) for line in f if line.strip()]
+    frames.sort(key=lambda frame: frame["t"])
+    return frames
+
+
+def synthetic_trace(config: dict, duration: float = 60.0, rate: float = 120.0, seed: int = 0) -> list:
+    """
+    Generates a trace with every action of the config moving: buttons are pressed and released at random,
+    analog values and fingers follow sine waves of different frequencies.
+    Parameters:
+        config (dict): Config
+        duration (float): Length of the trace in seconds
+        rate (float): Frames per second
+        seed (int): Seed of the random generator, the same seed gives the same trace
+    Returns:
+        list: Frames ordered by time
+    """
+    rng = random.Random(seed)
+    waves = {}
+
+    def wave(key, t, low=0.0):
+        if key not in waves:
+            waves[key] = (rng.uniform(0.1, 2.0), rng.uniform(0, 2 * math.pi))
+        frequency, phase = waves[key]
+        value = (math.sin(2 * math.pi * frequency * t + phase) + 1) / 2
+        return low + (1 - low) * value
+
+    frames = []
+    for i in range(int(duration * rate)):
+        t = i / rate
+        ovr = {}
+        for action in config["actions"]:
+            name = action["name"]
+            match action["type"]:
+                case "boolean":
+                    if rng.random() < 2 / rate:
+                        ovr[name] = rng.random() < 0.5
+                case "vector1":
+                    ovr[name] = wave(name, t)
+                case "vector2":
+                    ovr[name] = [wave(name + "/x", t, -1.0), wave(name + "/y", t, -1.0)]
+                case "skeleton":
+                    ovr[name] = [wave(f"{name}/{j}", t) for j in range(SKELETON_VALUES)]
+        xinput = {}
+        for name, default in DEFAULT_ACTIONS.items():
+            if isinstance(default, bool):
+                if rng.random() < 1 / rate:
+                    xinput[name] = rng.random() < 0.5
+            else:
+                xinput[name] = wave(name, t, 0.0 if name.endswith("Trigger") else -1.0)
+        frame = {"t": t, "ovr": ovr, "xinput": xinput}
+        if i == 0:
+            frame["controller_type"] = 1
+        frames.append(frame)
+    return frames
+
+
+class ReplayXboxController(XboxController):
+    """
+    XboxController whose values are set by a ReplayOVR instead of being polled from XInput.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.actions = dict(DEFAULT_ACTIONS)
+        self.plugged = False
+
+    @property
+    def is_plugged(self) -> bool:
+        return self.plugged
+
+    def _init_joystick(self) -> None:
+        self.joystick = None
+
+    def polling_loop(self) -> None:
+        # Values come from the trace on the main thread, there is nothing to poll
+        return
+
+
+class ReplayOVR:
+    """
+    OVR that plays back a trace instead of reading SteamVR.
+    Every poll_next_events applies the frames that are due, like updateActionState does for SteamVR.
+    A Quit event is dispatched once the trace has ended, so the main loop stops like it does when SteamVR quits.
+
+    speed: playback speed relative to the timestamps of the trace, 0 applies exactly one frame per poll
+    """
+
+    def __init__(self, frames: list, speed: float = 1.0, xinput: ReplayXboxController | None = None, clock=time.monotonic) -> None:
+        self.frames = frames
+        self.speed = speed
+        self.xinput = xinput
+        self.clock = clock
+        self.events = EventDispatcher()
+        self.event = openvr.VREvent_t()
+        self.values = {}
+        self.changed = set()
+        self.skeletons = {}
+        self.controller_type = 0
+        self.position = 0
+        self.start_time = None
+        self.ended = False
+        logging.info(f"Replaying {len(frames)} frames" + (" unthrottled." if speed <= 0 else f" at {speed:g}x speed."))
+
+
+    def _apply(self, frame: dict) -> None:
+        for name, value in frame.get("ovr", {}).items():
+            if name in self.skeletons:
+                self.skeletons[name][:] = value
+                self.values[name] = self.skeletons[name]
+                continue
+            if isinstance(value, list):
+                value = tuple(value)
+            if self.values.get(name) != value:
+                self.values[name] = value
+                self.changed.add(name)
+        if self.xinput is not None and "xinput" in frame:
+            self.xinput.actions.update(frame["xinput"])
+            self.xinput.plugged = True
+        if "controller_type" in frame:
+            self.controller_type = frame["controller_type"]
+
+
+    def poll_next_events(self) -> None:
+        """
+        Applies the frames that are due and dispatches a Quit event once the trace has ended.
+        Returns:
+            None
+        """
+        self.update_action_state()
+        self.drain_events()
+
+
+    def drain_events(self) -> None:
+        """
+        Dispatches a Quit event once the trace has ended.
+        Returns:
+            None
+        """
+        if self.position >= len(self.frames) and not self.ended:
+            self.ended = True
+            logging.info("Replay finished.")
+            self.event.eventType = openvr.VREvent_Quit
+            self.events.dispatch(self.event)
+
+
+    def update_action_state(self) -> None:
+        """
+        Applies the frames that are due.
+        Returns:
+            None
+        """
+        self.changed.clear()
+        if self.speed <= 0:
+            end = self.position + 1
+        else:
+            now = self.clock()
+            if self.start_time is None:
+                self.start_time = now
+            elapsed = (now - self.start_time) * self.speed
+            end = self.position
+            while end < len(self.frames) and self.frames[end]["t"] <= elapsed:
+                end += 1
+        for frame in self.frames[self.position:end]:
+            self._apply(frame)
+        self.position = min(end, len(self.frames))
+
+
+    def get_controllertype(self) -> int:
+        """
+        Gets the type of controller from the trace.
+        Returns:
+            int: Type of controller (0 = Unknown, 1 = Knuckles, 2 = Oculus/Meta Touch)
+        """
+        return self.controller_type
+
+
+    def get_reader(self, action: dict):
+        """
+        Gets a function without arguments that reads the value of an action from the trace.
+        Parameters:
+            action (dict): Action
+        Returns:
+            function: Reader of the action
+        """
+        name = action["name"]
+        if action["type"] == "skeleton":
+            self.skeletons.setdefault(name, (ctypes.c_float * SKELETON_VALUES)())
+            return partial(self.values.get, name)
+        if action["type"] not in DEFAULT_VALUES:
+            raise TypeError("Unknown action type: " + action["type"])
+        return partial(self.values.get, name, DEFAULT_VALUES[action["type"]])
+
+
+    def get_change_reader(self, action: dict):
+        """
+        Gets a function without arguments that reads the value of an action from the trace together with a change indicator.
+        Parameters:
+            action (dict): Action
+        Returns:
+            function: Reader of the action returning (value, changed), None for skeleton actions
+        """
+        if action["type"] == "skeleton":
+            return None
+        name, default = action["name"], DEFAULT_VALUES[action["type"]]
+        def read() -> tuple:
+            return self.values.get(name, default), name in self.changed
+        return read
+
+
+    def get_value(self, action: dict):
+        """
+        Gets the value of an action from the trace.
+        Parameters:
+            action (dict): Action
+        Returns:
+            any: Value of the action
+        """
+        return self.get_reader(action)()
+
+
+    def acknowledge_quit(self) -> None:
+        return
+
+
+    def shutdown(self) -> bool:
+        """Stops the replay."""
+        logging.info(f"Replayed {self.position} of {len(self.frames)} frames.")
+        return True
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+
+SKIP = "skip"
+CATCH_UP = "catchup"
+COALESCE = "coalesce"
+OVERRUN_POLICIES = (SKIP, CATCH_UP, COALESCE)
+# Catching up on more ticks than this would only flood VRChat with stale values
+MAX_CATCH_UP_TICKS = 10
+
+
+class TickScheduler:
+    """
+    Runs a function at a fixed rate using absolute deadlines, so time spent inside the function does not shift the cadence.
+
+    Overrun policies, applied when a tick finishes after the next deadline:
+        skip: drop the missed ticks and wait for the next deadline on the original grid
+        catchup: run the missed ticks back to back (at most MAX_CATCH_UP_TICKS)
+        coalesce: run a single tick immediately and restart the grid from there
+    """
+
+    def __init__(self, period: float, overrun_policy: str = SKIP, clock=time.monotonic, sleep=time.sleep) -> None:
+        overrun_policy = overrun_policy.lower().replace("_", "").replace("-", "")
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy: {overrun_policy}, expected one of {', '.join(OVERRUN_POLICIES)}")
+        self.period = period
+        self.overrun_policy = overrun_policy
+        self.clock = clock
+        self.sleep = sleep
+        self.running = False
+        self.deadline = 0.0
+        self.start_time = 0.0
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+
+    def start(self) -> None:
+        """
+        Resets the statistics and starts the deadline grid at the current time.
+        Returns:
+            None
+        """
+        self.running = True
+        self.start_time = self.deadline = self.clock()
+        self.ticks = self.overruns = self.skipped_ticks = 0
+
+    def wait(self) -> None:
+        """
+        Waits until the next deadline, applying the overrun policy if it has already passed.
+        Returns:
+            None
+        """
+        delay = self.next_delay()
+        if delay > 0:
+            self.sleep(delay)
+
+    def next_delay(self) -> float:
+        """
+        Advances to the next deadline, applying the overrun policy if it has already passed.
+        Returns:
+            float: Time to wait until the next tick, 0 to run it immediately
+        """
+        self.ticks += 1
+        if self.period <= 0:
+            # Unthrottled
+            return 0.0
+        self.deadline += self.period
+        now = self.clock()
+        if now < self.deadline:
+            return self.deadline - now
+
+        self.overruns += 1
+        missed = int((now - self.deadline) // self.period)
+        match self.overrun_policy:
+            case "skip":
+                self.skipped_ticks += missed + 1
+                self.deadline += (missed + 1) * self.period
+                return self.deadline - now
+            case "catchup":
+                if missed >= MAX_CATCH_UP_TICKS:
+                    self.skipped_ticks += missed - MAX_CATCH_UP_TICKS + 1
+                    self.deadline += (missed - MAX_CATCH_UP_TICKS + 1) * self.period
+            case "coalesce":
+                self.skipped_ticks += missed
+                self.deadline = now
+        return 0.0
+
+    def run(self, tick) -> None:
+        """
+        Calls tick once per period until stop() is called.
+        Parameters:
+            tick (function): Function to call every tick
+        Returns:
+            None
+        """
+        self.start()
+        while self.running:
+            tick()
+            self.wait()
+
+    async def run_async(self, tick) -> None:
+        """
+        Calls tick once per period until stop() is called, waiting on the running event loop in between.
+        Parameters:
+            tick (function): Function to call every tick
+        Returns:
+            None
+        """
+        self.start()
+        while self.running:
+            tick()
+            # Yield to the event loop even when running late, so received datagrams get handled
+            await asyncio.sleep(self.next_delay())
+
+    def stop(self) -> None:
+        """
+        Stops the scheduler after the current tick.
+        Returns:
+            None
+        """
+        self.running = False
+
+    @property
+    def effective_rate(self) -> float:
+        """
+        Gets the measured tick rate since start() in Hz.
+        Returns:
+            float: Effective tick rate
+        """
+        elapsed = self.clock() - self.start_time
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def log_stats(self) -> None:
+        """
+        Logs the tick statistics.
+        Returns:
+            None
+        """
+        logging.info(f"Ticks: {self.ticks}, effective rate: {self.effective_rate:.2f} Hz, overruns: {self.overruns}, skipped ticks: {self.skipped_ticks} ({self.overrun_policy})")
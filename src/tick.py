@@ -0,0 +1,23 @@
+def run_tick(ovr, osc, steps: list, recorder=None) -> None:
+    """
+    Runs one tick: polls SteamVR, runs the expired timers and the steps of the compiled actions and sends the pending messages.
+    Parameters:
+        ovr (OVR): SteamVR input
+        osc (OSC): OSC client
+        steps (list): Callables of the compiled actions, see actions.get_steps()
+        recorder (FlightRecorder | None): Flight recorder
+    Returns:
+        None
+    """
+    if recorder is not None:
+        recorder.begin_tick()
+    ovr.poll_next_events()
+    osc.refresh_time()
+    osc.run_timers()
+
+    for step in steps:
+        step()
+
+    osc.flush()
+    if recorder is not None:
+        recorder.end_tick()
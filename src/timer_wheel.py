@@ -0,0 +1,86 @@
+class Timer:
+    """
+    A timer that can be scheduled on a TimerWheel. A timer is pending while it is scheduled and has not fired yet.
+    Rescheduling a pending timer moves it, so one Timer object can be reused for the lifetime of its owner.
+    """
+    __slots__ = ("callback", "deadline", "slot")
+
+    def __init__(self, callback=None) -> None:
+        self.callback = callback
+        self.deadline = 0.0
+        self.slot = None
+
+    @property
+    def pending(self) -> bool:
+        return self.slot is not None
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel. Timers are bucketed by deadline into slots of a fixed resolution,
+    so scheduling, moving and cancelling are O(1) and advancing only visits the slots that elapsed.
+    Timers further away than one rotation stay in their slot until their deadline has passed.
+    """
+
+    def __init__(self, resolution: float = 0.005, slots: int = 512) -> None:
+        self.resolution = resolution
+        self.slots = [set() for _ in range(slots)]
+        self.current_tick = None
+
+    def _tick(self, t: float) -> int:
+        return int(t / self.resolution)
+
+    def schedule(self, timer: Timer, deadline: float) -> None:
+        """
+        Schedules a timer to fire at the given time, moving it if it is already pending.
+        Parameters:
+            timer (Timer): Timer to schedule
+            deadline (float): Time at which the timer fires
+        Returns:
+            None
+        """
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+        tick = self._tick(deadline)
+        if self.current_tick is not None and tick < self.current_tick:
+            # Already due, fire it with the next advance
+            tick = self.current_tick
+        timer.deadline = deadline
+        timer.slot = self.slots[tick % len(self.slots)]
+        timer.slot.add(timer)
+
+    def cancel(self, timer: Timer) -> None:
+        """
+        Cancels a pending timer.
+        Parameters:
+            timer (Timer): Timer to cancel
+        Returns:
+            None
+        """
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+            timer.slot = None
+
+    def advance(self, now: float) -> None:
+        """
+        Fires every timer with a deadline at or before now.
+        Parameters:
+            now (float): Current time
+        Returns:
+            None
+        """
+        tick = self._tick(now)
+        # A full rotation visits every slot, anything more would only visit them again
+        start = tick - len(self.slots) + 1
+        if self.current_tick is not None:
+            start = max(start, self.current_tick)
+        self.current_tick = tick
+        for t in range(start, tick + 1):
+            slot = self.slots[t % len(self.slots)]
+            if not slot:
+                continue
+            for timer in [timer for timer in slot if timer.deadline <= now]:
+                slot.discard(timer)
+                timer.slot = None
+                if timer.callback is not None:
+                    timer.callback()
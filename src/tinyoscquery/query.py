@@ -1,57 +1,126 @@
 import time
+import threading
 from zeroconf import ServiceBrowser, ServiceInfo, ServiceListener, Zeroconf
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .shared.node import OSCQueryNode, OSC_Type_String_to_Python_Type, OSCAccess, OSCHostInfo
+from .utility import get_zeroconf
 
 class OSCQueryListener(ServiceListener):
 
     def __init__(self) -> None:
         self.osc_services = {}
         self.oscjson_services = {}
+        # Notified whenever a service is added, updated or removed, generation counts the changes
+        self.changed = threading.Condition()
+        self.generation = 0
 
         super().__init__()
 
     def remove_service(self, zc: 'Zeroconf', type_: str, name: str) -> None:
-        if name in self.osc_services:
-            del self.osc_services[name]
+        with self.changed:
+            if name in self.osc_services:
+                del self.osc_services[name]
 
-        if name in self.oscjson_services:
-            del self.oscjson_services[name]
+            if name in self.oscjson_services:
+                del self.oscjson_services[name]
+            self.generation += 1
+            self.changed.notify_all()
 
     def add_service(self, zc: 'Zeroconf', type_: str, name: str) -> None:
-        if type_ == '_osc._udp.local.':
-            self.osc_services[name] = zc.get_service_info(type_, name)
-        elif type_ == '_oscjson._tcp.local.':
-            self.oscjson_services[name] = zc.get_service_info(type_, name)
+        info = zc.get_service_info(type_, name)
+        if info is None:
+            return
+        with self.changed:
+            if type_ == '_osc._udp.local.':
+                self.osc_services[name] = info
+            elif type_ == '_oscjson._tcp.local.':
+                self.oscjson_services[name] = info
+            self.generation += 1
+            self.changed.notify_all()
 
     def update_service(self, zc: 'Zeroconf', type_: str, name: str) -> None:
-        if type_ == '_osc._udp.local.':
-            self.osc_services[name] = zc.get_service_info(type_, name)
-        elif type_ == '_oscjson._tcp.local.':
-            self.oscjson_services[name] = zc.get_service_info(type_, name)
+        self.add_service(zc, type_, name)
 
 
 class OSCQueryBrowser(object):
-    def __init__(self) -> None:
+    """
+    Browses for OSC and OSCQuery services on the shared Zeroconf instance.
+    HOST_INFO names are cached per service, so every service is asked at most once.
+    """
+
+    def __init__(self, zc=None) -> None:
         self.listener = OSCQueryListener()
-        self.zc = Zeroconf()
+        self.zc = zc if zc is not None else get_zeroconf()
         self.browser = ServiceBrowser(self.zc, ["_oscjson._tcp.local.", "_osc._udp.local."], self.listener)
+        self._host_names = {}
+
+    def close(self):
+        self.browser.cancel()
 
     def get_discovered_osc(self):
-        return [oscsvc[1] for oscsvc in self.listener.osc_services.items()]
+        with self.listener.changed:
+            return list(self.listener.osc_services.values())
 
     def get_discovered_oscquery(self):
-        return [oscjssvc[1] for oscjssvc in self.listener.oscjson_services.items()]
+        with self.listener.changed:
+            return list(self.listener.oscjson_services.values())
+
+    def _get_host_name(self, svc):
+        host_name = self._host_names.get(svc.name)
+        if host_name is None:
+            host_info = OSCQueryClient(svc).get_host_info()
+            if host_info is None:
+                return ""
+            self._host_names[svc.name] = host_name = host_info.name
+        return host_name
 
     def find_service_by_name(self, name):
-        for svc in self.get_discovered_oscquery():
-            client = OSCQueryClient(svc)
-            if name in client.get_host_info().name:
+        services = self.get_discovered_oscquery()
+        # The service name usually carries the host name already, like VRChat-Client-XXXXXX._oscjson._tcp.local.
+        for svc in services:
+            if name in svc.name:
+                return svc
+        for svc in services:
+            if name in self._get_host_name(svc):
                 return svc
 
         return None
 
+    def wait_for_service(self, name, timeout=None):
+        """
+        Waits until an OSCQuery service with the given name is announced.
+
+        Parameters
+        ----------
+        name : str
+            Part of the service or HOST_INFO name
+        timeout : float
+            Seconds to wait at most, None to wait forever
+
+        Returns
+        -------
+        ServiceInfo
+            The service, None if the timeout passed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = self.listener.changed
+        while True:
+            # Taken before the check, so a service announced during the HOST_INFO requests is not missed
+            with changed:
+                generation = self.listener.generation
+            svc = self.find_service_by_name(name)
+            if svc is not None:
+                return svc
+            with changed:
+                while self.listener.generation == generation:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    changed.wait(remaining)
+
     def find_nodes_by_endpoint_address(self, address) -> list[tuple[ServiceInfo, OSCHostInfo, OSCQueryNode]]:
         svcs = []
         for svc in self.get_discovered_oscquery():
@@ -66,8 +135,43 @@ class OSCQueryBrowser(object):
         return svcs
 
 
+# Keep-alive sessions shared by all clients of the same service, keyed by query root
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_session(query_root, retries):
+    with _sessions_lock:
+        session = _sessions.get(query_root)
+        if session is None:
+            retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                allowed_methods=("GET",), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            _sessions[query_root] = session
+        return session
+
+
 class OSCQueryClient(object):
-    def __init__(self, service_info) -> None:
+    """
+    Queries an OSCQuery service over a pooled keep-alive session, with timeouts, retries and a short lived response cache.
+
+    Attributes
+    ----------
+    service_info : ServiceInfo
+        Zeroconf service info of the OSCQuery service
+    timeout : tuple
+        Connect and read timeout in seconds
+    cache_ttl : float
+        Seconds a node query is answered from the cache, 0 disables the cache
+    host_info_ttl : float
+        Seconds HOST_INFO is answered from the cache
+    retries : int
+        Retries of a failed request, with exponential backoff
+    """
+
+    def __init__(self, service_info, timeout=(1.0, 3.0), cache_ttl=1.0, host_info_ttl=30.0, retries=2) -> None:
         if not isinstance(service_info, ServiceInfo):
             raise Exception("service_info isn't a ServiceInfo class!")
 
@@ -76,50 +180,97 @@ class OSCQueryClient(object):
 
         self.service_info = service_info
         self.last_json = None
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.host_info_ttl = host_info_ttl
+        self._ip_str = '.'.join([str(int(num)) for num in self.service_info.addresses[0]])
+        self._query_root = f"http://{self._ip_str}:{self.service_info.port}"
+        self._session = _get_session(self._query_root, retries)
+        # Path to (expiry time, validator headers, json)
+        self._cache = {}
 
     def _get_query_root(self):
-        return f"http://{self._get_ip_str()}:{self.service_info.port}"
+        return self._query_root
 
     def _get_ip_str(self):
-        ip_str = '.'.join([str(int(num)) for num in self.service_info.addresses[0]])
-        return ip_str
+        return self._ip_str
+
+    def invalidate(self, path=None):
+        """
+        Drops cached responses, so the next query goes to the service.
+
+        Parameters
+        ----------
+        path : str
+            Path to drop, None to drop everything
+        """
+        if path is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(path, None)
+
+    def _get_json(self, path, ttl):
+        """
+        Gets the JSON of a path from the cache or the service.
+        Expired entries that came with an ETag or Last-Modified header are revalidated with a conditional request.
+
+        Returns
+        -------
+        tuple
+            Status code and JSON, None if the service could not be reached
+        """
+        now = time.monotonic()
+        cached = self._cache.get(path)
+        if cached is not None and now < cached[0]:
+            return 200, cached[2]
+
+        headers = cached[1] if cached is not None else None
+        r = self._session.get(self._query_root + path, headers=headers, timeout=self.timeout)
+        if r.status_code == 304 and cached is not None:
+            self._cache[path] = (now + ttl, cached[1], cached[2])
+            return 200, cached[2]
+        if r.status_code != 200:
+            self._cache.pop(path, None)
+            return r.status_code, r.content
 
-    def query_node(self, node="/"):
-        url = self._get_query_root() + node
-        r = None
+        json = r.json()
+        if ttl > 0:
+            validators = {}
+            if "ETag" in r.headers:
+                validators["If-None-Match"] = r.headers["ETag"]
+            if "Last-Modified" in r.headers:
+                validators["If-Modified-Since"] = r.headers["Last-Modified"]
+            self._cache[path] = (now + ttl, validators or None, json)
+        return 200, json
+
+    def query_node(self, node="/", cache=True):
         try:
-            r = requests.get(url)
+            status, json = self._get_json(node, self.cache_ttl if cache else 0)
         except Exception as ex:
             print("Error querying node...", ex)
-        if r is None:
             return None
 
-        if r.status_code == 404:
+        if status == 404:
             return None
         
-        if r.status_code != 200:
-            raise Exception("Node query error: (HTTP", r.status_code, ") ", r.content)
+        if status != 200:
+            raise Exception("Node query error: (HTTP", status, ") ", json)
 
-        self.last_json = r.json()
+        self.last_json = json
 
         return self._make_node_from_json(self.last_json)
 
 
-    def get_host_info(self):
-        url = self._get_query_root() + "/HOST_INFO"
-        r = None
+    def get_host_info(self, cache=True):
         try:
-            r = requests.get(url)
+            status, json = self._get_json("/HOST_INFO", self.host_info_ttl if cache else 0)
         except Exception as ex:
             #print("Error querying HOST_INFO...", ex)
-            pass
-        if r is None:
             return None
 
-        if r.status_code != 200:
-            raise Exception("Node query error: (HTTP", r.status_code, ") ", r.content)
+        if status != 200:
+            raise Exception("Node query error: (HTTP", status, ") ", json)
 
-        json = r.json()
         hi = OSCHostInfo(json["NAME"], json['EXTENSIONS'])
         if 'OSC_IP' in json:
             hi.osc_ip = json["OSC_IP"]
@@ -1,6 +1,7 @@
-from zeroconf import ServiceInfo, Zeroconf
-from http.server import SimpleHTTPRequestHandler, HTTPServer
+from zeroconf import ServiceInfo
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from .shared.node import OSCQueryNode, OSCHostInfo, OSCAccess
+from .utility import get_zeroconf
 import json, threading
 
 
@@ -16,9 +17,11 @@ class OSCQueryService(object):
         Desired TCP port number for the oscjson HTTP server
     oscPort : int
         Desired UDP port number for the osc server
+    zeroconf : Zeroconf
+        Zeroconf instance to advertise on, the shared one by default
     """
     
-    def __init__(self, serverName, httpPort, oscPort, oscIp="127.0.0.1") -> None:
+    def __init__(self, serverName, httpPort, oscPort, oscIp="127.0.0.1", zeroconf=None) -> None:
         self.serverName = serverName
         self.httpPort = httpPort
         self.oscPort = oscPort
@@ -28,7 +31,8 @@ class OSCQueryService(object):
         self.host_info = OSCHostInfo(serverName, {"ACCESS":True,"CLIPMODE":False,"RANGE":True,"TYPE":True,"VALUE":True}, 
             self.oscIp, self.oscPort, "UDP")
 
-        self._zeroconf = Zeroconf()
+        self._zeroconf = zeroconf if zeroconf is not None else get_zeroconf()
+        self._service_infos = []
         self._startOSCQueryService()
         self._advertiseOSCService()
         self.http_server = OSCQueryHTTPServer(self.root_node, self.host_info, ('', self.httpPort), OSCQueryHTTPHandler)
@@ -37,10 +41,29 @@ class OSCQueryService(object):
 
     def stop(self):
         self.http_server.shutdown()
+        for info in self._service_infos:
+            self._zeroconf.unregister_service(info)
+        self._service_infos = []
+
+    def add_route(self, path, handler):
+        """
+        Serves something other than OSCQuery nodes from the HTTP server.
+
+        Parameters
+        ----------
+        path : str
+            Path to serve, without query string
+        handler : function
+            Function without arguments returning the content type and the body as a string
+        """
+        self.http_server.routes[path] = handler
 
     def add_node(self, node):
         self.root_node.add_child_node(node)
 
+    def remove_node(self, address):
+        return self.root_node.remove_child_node(address)
+
     def advertise_endpoint(self, address, value=None, access=OSCAccess.READWRITE_VALUE):
         new_node = OSCQueryNode(full_path=address, access=access)
         if value is not None:
@@ -52,11 +75,28 @@ class OSCQueryService(object):
                 new_node.type_ = [type(v) for v in value]
         self.add_node(new_node)
 
+    def set_value(self, address, value):
+        """
+        Changes the value of an advertised endpoint, the cached JSON of it and its parents is rebuilt on the next query.
+
+        Parameters
+        ----------
+        address : str
+            OSC address of the endpoint
+        value : any
+            New value, or list of values
+        """
+        node = self.root_node.find_subnode(address)
+        if node is None:
+            raise KeyError(address)
+        node.set_value(value if isinstance(value, list) else [value])
+
     def _startOSCQueryService(self):
         oscqsDesc = {'txtvers': 1}
         oscqsInfo = ServiceInfo("_oscjson._tcp.local.", "%s._oscjson._tcp.local." % self.serverName, self.httpPort, 
         0, 0, oscqsDesc, "%s.oscjson.local." % self.serverName, addresses=["127.0.0.1"])
         self._zeroconf.register_service(oscqsInfo)
+        self._service_infos.append(oscqsInfo)
 
 
     def _startHTTPServer(self):
@@ -68,35 +108,70 @@ class OSCQueryService(object):
         0, 0, oscDesc, "%s.osc.local." % self.serverName, addresses=["127.0.0.1"])
 
         self._zeroconf.register_service(oscInfo)
+        self._service_infos.append(oscInfo)
+
 
+class OSCQueryHTTPServer(ThreadingHTTPServer):
+    """
+    Serves every request on its own thread, so a slow client can't hold up the others.
+    """
+    daemon_threads = True
 
-class OSCQueryHTTPServer(HTTPServer):
     def __init__(self, root_node, host_info, server_address: tuple[str, int], RequestHandlerClass, bind_and_activate: bool = ...) -> None:
         super().__init__(server_address, RequestHandlerClass, bind_and_activate)
         self.root_node = root_node
         self.host_info = host_info
+        self.routes = {}
+        self._host_info_json = None
+
+    def get_host_info_json(self):
+        if self._host_info_json is None:
+            self._host_info_json = self.host_info.to_json().encode('utf-8')
+        return self._host_info_json
+
+    def invalidate_host_info(self):
+        self._host_info_json = None
 
 
 class OSCQueryHTTPHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between the queries of a client
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in one segment, otherwise Nagle and delayed ACKs stall every keep-alive response by ~40ms
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _send(self, code, content_type, body) -> None:
+        self.send_response(code)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self) -> None:
-        if 'HOST_INFO' in self.path:
-            self.send_response(200)
-            self.send_header("Content-type", "text/json")
-            self.end_headers()
-            self.wfile.write(bytes(str(self.server.host_info.to_json()), 'utf-8'))
+        path, _, attribute = self.path.partition("?")
+        route = self.server.routes.get(path)
+        if route is not None:
+            content_type, body = route()
+            self._send(200, content_type, bytes(body, 'utf-8'))
             return
-        node = self.server.root_node.find_subnode(self.path)
+        if attribute == "HOST_INFO" or 'HOST_INFO' in path:
+            self._send(200, "text/json", self.server.get_host_info_json())
+            return
+        node = self.server.root_node.find_subnode(path)
         if node is None:
-            self.send_response(404)
-            self.send_header("Content-type", "text/json")
-            self.end_headers()
-            self.wfile.write(bytes("OSC Path not found", 'utf-8'))
-        else:
-            self.send_response(200)
-            self.send_header("Content-type", "text/json")
+            self._send(404, "text/json", b"OSC Path not found")
+            return
+        if not attribute:
+            self._send(200, "text/json", node.get_json_bytes())
+            return
+        body = node.get_json_bytes(attribute.upper())
+        if body is None:
+            # The node exists but has no such attribute
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
             self.end_headers()
-            self.wfile.write(bytes(str(node.to_json()), 'utf-8'))
+            return
+        self._send(200, "text/json", body)
 
     def log_message(self, format, *args):
         pass
-            
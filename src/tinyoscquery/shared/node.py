@@ -7,7 +7,7 @@ class OSCNodeEncoder(JSONEncoder):
         if isinstance(o, OSCQueryNode):
             obj_dict = {}
             for k, v in vars(o).items():
-                if v is None:
+                if v is None or k.startswith("_"):
                     continue
                 if k.lower() == "type_":
                     obj_dict["TYPE"] = Python_Type_List_to_OSC_Type(v)
@@ -56,22 +56,95 @@ class OSCQueryNode():
         self.value = value
         self.description = description
         self.host_info = host_info
+        # Serialization cache, private attributes are not serialized
+        self._parent = None
+        self._json = None
+        self._attribute_json = {}
+        self._version = 0
+        # Full path to node index of the subtree, built on the first lookup and kept up to date by add/remove_child_node
+        self._index = None
+
+
+    def invalidate(self):
+        """Drops the cached JSON of this node and of every node above it, as their JSON contains this one."""
+        node = self
+        while node is not None:
+            node._json = None
+            node._attribute_json = {}
+            node._version += 1
+            node = node._parent
+
+
+    def set_value(self, value):
+        """Sets the value of the node and invalidates the cached JSON."""
+        self.value = value
+        self.invalidate()
+
+
+    def get_json_bytes(self, attribute=None):
+        """
+        Gets the serialized node, or a single attribute of it, from the cache.
+
+        Parameters
+        ----------
+        attribute : str
+            OSCQuery attribute like VALUE or TYPE, None for the whole node
+
+        Returns
+        -------
+        bytes
+            UTF-8 encoded JSON, None if the node has no such attribute
+        """
+        version = self._version
+        if attribute is None:
+            data = self._json
+            if data is None:
+                data = self.to_json().encode('utf-8')
+                if version == self._version:
+                    self._json = data
+            return data
+
+        attributes = self._attribute_json
+        if attribute not in attributes:
+            obj_dict = OSCNodeEncoder().default(self)
+            data = json.dumps({attribute: obj_dict[attribute]}, cls=OSCNodeEncoder).encode('utf-8') if attribute in obj_dict else None
+            if version != self._version:
+                return data
+            attributes[attribute] = data
+        return attributes[attribute]
+
+
+    def _get_index(self):
+        if self._index is None:
+            index = {}
+            for node in self:
+                index.setdefault(node.full_path, node)
+                # Trees built from contents lists, like the ones returned by OSCQueryClient, get their parent links here,
+                # so later changes below this node reach its index and cached JSON
+                if node.contents is not None:
+                    for subNode in node.contents:
+                        subNode._parent = node
+            self._index = index
+        return self._index
 
 
     def find_subnode(self, full_path):
-        if self.full_path == full_path:
-            return self
-
-        foundNode = None
-        if self.contents is None:
-            return None
-        
-        for subNode in self.contents:
-            foundNode = subNode.find_subnode(full_path)
-            if foundNode is not None:
-                break
-
-        return foundNode
+        return self._get_index().get(full_path)
+
+
+    def _update_indexes(self, child, add):
+        # Every node above the child that has an index gets the subtree of the child added or removed
+        subtree = list(child)
+        node = self
+        while node is not None:
+            index = node._index
+            if index is not None:
+                for subNode in subtree:
+                    if add:
+                        index.setdefault(subNode.full_path, subNode)
+                    elif index.get(subNode.full_path) is subNode:
+                        del index[subNode.full_path]
+            node = node._parent
 
     def add_child_node(self, child):
         if child == self:
@@ -96,6 +169,34 @@ class OSCQueryNode():
         if parent.contents is None:
             parent.contents = []
         parent.contents.append(child)
+        child._parent = parent
+        parent._update_indexes(child, True)
+        parent.invalidate()
+
+
+    def remove_child_node(self, full_path):
+        """
+        Removes a node and everything below it from the tree.
+
+        Parameters
+        ----------
+        full_path : str
+            Full path of the node to remove
+
+        Returns
+        -------
+        OSCQueryNode
+            The removed node, None if there is no such node below this one
+        """
+        child = self.find_subnode(full_path)
+        if child is None or child is self:
+            return None
+        parent = child._parent
+        parent.contents.remove(child)
+        parent._update_indexes(child, False)
+        child._parent = None
+        parent.invalidate()
+        return child
 
     
     def to_json(self):
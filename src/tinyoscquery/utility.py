@@ -1,4 +1,32 @@
 import socket
+import threading
+from zeroconf import Zeroconf
+
+_zeroconf = None
+_zeroconf_lock = threading.Lock()
+
+def get_zeroconf():
+    '''
+    Returns the Zeroconf instance shared by browsing and advertising, starting it on first use.
+
+        Returns:
+            zeroconf (Zeroconf): The shared Zeroconf instance
+    '''
+    global _zeroconf
+    with _zeroconf_lock:
+        if _zeroconf is None:
+            _zeroconf = Zeroconf()
+        return _zeroconf
+
+def close_zeroconf():
+    '''
+    Closes the shared Zeroconf instance, unregistering every service advertised on it.
+    '''
+    global _zeroconf
+    with _zeroconf_lock:
+        if _zeroconf is not None:
+            _zeroconf.close()
+            _zeroconf = None
 
 def get_open_tcp_port():
     '''
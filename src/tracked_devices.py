@@ -0,0 +1,191 @@
+import openvr
+import openvr.error_code
+import logging
+
+CONTROLLER_TYPES = {
+    "knuckles": 1,
+    "oculus_touch": 2
+}
+
+# Properties that are kept in the registry, a PropertyChanged event for any other property is ignored
+STRING_PROPERTIES = {
+    openvr.Prop_ControllerType_String: "controller_type",
+    openvr.Prop_SerialNumber_String: "serial_number",
+    openvr.Prop_ModelNumber_String: "model_number"
+}
+INT32_PROPERTIES = {
+    openvr.Prop_ControllerRoleHint_Int32: "role"
+}
+# Events that change the registry
+DEVICE_EVENTS = (
+    openvr.VREvent_TrackedDeviceActivated,
+    openvr.VREvent_TrackedDeviceDeactivated,
+    openvr.VREvent_TrackedDeviceUpdated,
+    openvr.VREvent_TrackedDeviceRoleChanged,
+    openvr.VREvent_PropertyChanged
+)
+
+
+class TrackedDevice:
+    """
+    Cached properties of a tracked device.
+    """
+    __slots__ = ("index", "device_class", "controller_type", "serial_number", "model_number", "role")
+
+    def __init__(self, index: int, device_class: int) -> None:
+        self.index = index
+        self.device_class = device_class
+        self.controller_type = ""
+        self.serial_number = ""
+        self.model_number = ""
+        self.role = openvr.TrackedControllerRole_Invalid
+
+
+class TrackedDeviceRegistry:
+    """
+    Index of the connected tracked devices and the properties this application needs.
+    It is filled once with refresh() and then kept current from SteamVR events,
+    so no property is queried from SteamVR while polling.
+    """
+
+    def __init__(self, system) -> None:
+        self.system = system
+        self.devices = {}
+        self.controller_type = 0
+
+
+    def _get_string_property(self, index: int, prop: int) -> str:
+        try:
+            return self.system.getStringTrackedDeviceProperty(index, prop)
+        except openvr.error_code.TrackedPropertyError:
+            return ""
+
+
+    def _get_int32_property(self, index: int, prop: int) -> int:
+        try:
+            return self.system.getInt32TrackedDeviceProperty(index, prop)
+        except openvr.error_code.TrackedPropertyError:
+            return 0
+
+
+    def _update_controller_type(self) -> None:
+        # The first controller decides, like the device scan this replaces
+        for index in sorted(self.devices):
+            device = self.devices[index]
+            if device.device_class == openvr.TrackedDeviceClass_Controller:
+                self.controller_type = CONTROLLER_TYPES.get(device.controller_type, 0)
+                return
+        self.controller_type = 0
+
+
+    def refresh(self) -> None:
+        """
+        Queries every tracked device from SteamVR.
+        Returns:
+            None
+        """
+        self.devices.clear()
+        for index in range(1, openvr.k_unMaxTrackedDeviceCount):
+            self.update_device(index, update_controller_type=False)
+        self._update_controller_type()
+        logging.info(f"Found {len(self.devices)} tracked devices.")
+
+
+    def update_device(self, index: int, update_controller_type: bool = True) -> None:
+        """
+        Queries the class and properties of a tracked device from SteamVR.
+        Parameters:
+            index (int): Tracked device index
+            update_controller_type (bool): True to recompute the controller type
+        Returns:
+            None
+        """
+        device_class = self.system.getTrackedDeviceClass(index)
+        if device_class == openvr.TrackedDeviceClass_Invalid:
+            self.devices.pop(index, None)
+        else:
+            device = TrackedDevice(index, device_class)
+            for prop, name in STRING_PROPERTIES.items():
+                setattr(device, name, self._get_string_property(index, prop))
+            for prop, name in INT32_PROPERTIES.items():
+                setattr(device, name, self._get_int32_property(index, prop))
+            self.devices[index] = device
+        if update_controller_type:
+            self._update_controller_type()
+
+
+    def update_property(self, index: int, prop: int) -> None:
+        """
+        Queries a single property of a tracked device from SteamVR, if it is kept in the registry.
+        Parameters:
+            index (int): Tracked device index
+            prop (int): Property that changed
+        Returns:
+            None
+        """
+        device = self.devices.get(index)
+        if device is None:
+            if prop in STRING_PROPERTIES or prop in INT32_PROPERTIES:
+                self.update_device(index)
+            return
+        if prop in STRING_PROPERTIES:
+            setattr(device, STRING_PROPERTIES[prop], self._get_string_property(index, prop))
+        elif prop in INT32_PROPERTIES:
+            setattr(device, INT32_PROPERTIES[prop], self._get_int32_property(index, prop))
+        else:
+            return
+        self._update_controller_type()
+
+
+    def remove_device(self, index: int) -> None:
+        """
+        Removes a tracked device that was deactivated.
+        Parameters:
+            index (int): Tracked device index
+        Returns:
+            None
+        """
+        if self.devices.pop(index, None) is not None:
+            self._update_controller_type()
+
+
+    def handle_event(self, event: openvr.VREvent_t) -> None:
+        """
+        Updates the registry from one of the DEVICE_EVENTS.
+        Parameters:
+            event (openvr.VREvent_t): Event
+        Returns:
+            None
+        """
+        match event.eventType:
+            case openvr.VREvent_TrackedDeviceActivated | openvr.VREvent_TrackedDeviceUpdated:
+                self.update_device(event.trackedDeviceIndex)
+            case openvr.VREvent_TrackedDeviceRoleChanged:
+                # Not sent for a specific device, roles may have been swapped between controllers
+                self.refresh()
+            case openvr.VREvent_TrackedDeviceDeactivated:
+                self.remove_device(event.trackedDeviceIndex)
+            case openvr.VREvent_PropertyChanged:
+                self.update_property(event.trackedDeviceIndex, event.data.property.prop)
+
+
+    def get(self, index: int) -> TrackedDevice | None:
+        """
+        Gets a tracked device.
+        Parameters:
+            index (int): Tracked device index
+        Returns:
+            TrackedDevice | None: Device, None if there is no device at that index
+        """
+        return self.devices.get(index)
+
+
+    def get_devices(self, device_class: int) -> list:
+        """
+        Gets all tracked devices of a class.
+        Parameters:
+            device_class (int): Tracked device class
+        Returns:
+            list: Devices ordered by index
+        """
+        return [self.devices[index] for index in sorted(self.devices) if self.devices[index].device_class == device_class]
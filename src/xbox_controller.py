@@ -2,8 +2,7 @@ import asyncio
 import logging
 import math
 import time
-
-from xinput_joystick import XInputJoystick
+from functools import partial
 
 DEFAULT_ACTIONS = {
     "LeftJoystickY": 0.0,
@@ -119,14 +118,16 @@ class XboxController:
         # use this to measure actual polling rate
         self.num_polls = 0
         self.start_polling_time = 0
+        self.effective_polling_rate = 0.0
 
     @property
     def is_plugged(self):
-        return (
-            isinstance(self.joystick, XInputJoystick) and self.joystick.is_connected()
-        )
+        return self.joystick is not None and self.joystick.is_connected()
 
     def _init_joystick(self):
+        # Imported here, xinput_joystick loads the XInput DLL on import, which only exists on Windows
+        from xinput_joystick import XInputJoystick
+
         joysticks = XInputJoystick.enumerate_devices()
         if len(joysticks) > 0:
             self.joystick = joysticks[0]
@@ -190,6 +191,7 @@ class XboxController:
             if target_start_time - delta_time < self.start_polling_time:
                 period_time = current_time - self.start_polling_time
                 rate = self.num_polls / period_time
+                self.effective_polling_rate = rate
                 if self.tune_sleep_time:
                     self.sleep_time *= 1 - (
                         (self.polling_rate - rate) / self.polling_rate
@@ -212,10 +214,32 @@ class XboxController:
             The value of the action. If the action is a joystick or DPad action, it returns a tuple of two floats.
             If the action is not found, it raises a ValueError.
         """
+        return self.get_reader(action)()
+
+    def get_reader(self, action: dict):
+        """
+        Retrieves a function without arguments that reads the value of a specified action.
+
+        Parameters:
+        ----------
+            action : dict
+                The action to retrieve the reader for.
+
+        Returns:
+        -------
+            A function returning the current value of the action.
+            If the action is not found, it raises a ValueError.
+        """
         name = action["name"]
         if name in self.actions:
-            return self.actions[name]
-        elif name == "LeftJoystickXY":
+            return partial(self.actions.get, name)
+        elif name in ("LeftJoystickXY", "RightJoystickXY", "DPadXY"):
+            return partial(self._get_vector2, name)
+        else:
+            raise ValueError(f"Value for {name} not found.")
+
+    def _get_vector2(self, name: str) -> tuple[float, float]:
+        if name == "LeftJoystickXY":
             return dz_scaled_radial(
                 self.actions["LeftJoystickX"],
                 self.actions["LeftJoystickY"],
@@ -231,8 +255,6 @@ class XboxController:
             x = -float(self.actions["LeftDPad"]) + float(self.actions["RightDPad"])
             y = -float(self.actions["DownDPad"]) + float(self.actions["UpDPad"])
             return x, y
-        else:
-            raise ValueError(f"Value for {name} not found.")
 
 
 def map_range(v, old_min, old_max, new_min, new_max) -> float: